@@ -0,0 +1,272 @@
+"""
+猜歌插件热路径基准测试。
+
+生成含 N 首曲目、M 条别名的合成 songs_db.json 与对应的提示图片目录，
+再向 GameManager 回放多群聊天流量（大部分为普通聊天，其余为 /mg guess、/mg tip、/mg rank），
+统计每种操作的吞吐、p50/p99 延迟以及写入磁盘的字节数。
+
+无需 AstrBot，使用内置的 astrbot.api 桩模块离线运行：
+
+    python bench/benchmark.py --songs 2000 --aliases 8000 --groups 200 --messages 50000
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import string
+import sys
+import tempfile
+import time
+import types
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+PACKAGE = 'data.plugins.astrbot_plugin_mg_guessr'
+
+
+def install_stubs():
+    """注册 astrbot.api 桩模块，并把仓库目录挂载为插件包"""
+    def module(name, **attrs):
+        mod = types.ModuleType(name)
+        mod.__dict__.update(attrs)
+        sys.modules[name] = mod
+        return mod
+
+    class _Filter:
+        class EventMessageType:
+            ALL = 'all'
+
+        class PermissionType:
+            ADMIN = 'admin'
+
+        def __getattr__(self, name):
+            def decorator_factory(*args, **kwargs):
+                def decorator(func):
+                    func.command = lambda *a, **k: (lambda f: f)
+                    return func
+                return decorator
+            return decorator_factory
+
+    class _Star:
+        def __init__(self, context, *args):
+            self.context = context
+
+    logger = logging.getLogger('mg-guessr-bench')
+    module('astrbot')
+    module('astrbot.api', logger=logger, AstrBotConfig=dict)
+    module('astrbot.api.event', filter=_Filter(), AstrMessageEvent=object,
+           MessageEventResult=object, MessageChain=list)
+    module('astrbot.api.star', Context=object, Star=_Star,
+           register=lambda *a, **k: (lambda cls: cls))
+    module('astrbot.api.message_components', Plain=str, Image=object)
+    for name in ('data', 'data.plugins'):
+        module(name).__path__ = []
+    module(PACKAGE).__path__ = [REPO_DIR]
+
+
+def random_word(rng, low=3, high=10):
+    return ''.join(rng.choice(string.ascii_lowercase) for _ in range(rng.randint(low, high)))
+
+
+def make_songlist(rng, n_songs):
+    songs = []
+    for i in range(n_songs):
+        title = ' '.join(random_word(rng).capitalize() for _ in range(rng.randint(1, 4)))
+        difficulties = [{'ratingClass': c, 'rating': rng.randint(1, 12), 'ratingPlus': rng.random() < 0.3,
+                         'chartDesigner': random_word(rng)} for c in range(rng.randint(3, 5))]
+        songs.append({
+            'id': f"song{i}",
+            'title_localized': {'en': f"{title} {i}"},
+            'set': f"pack{rng.randint(0, 40)}",
+            'artist': f"artist{rng.randint(0, n_songs // 4 + 1)}",
+            'side': rng.randint(0, 3),
+            'bg': f"bg{rng.randint(0, 30)}",
+            'version': f"{rng.randint(1, 6)}.{rng.randint(0, 9)}",
+            'difficulties': difficulties,
+        })
+    return {'songs': songs}
+
+
+def make_catalog(workdir, n_songs, n_aliases, hint_ratio, seed):
+    """生成合成目录与提示目录，返回 (songs_db 路径, 曲名列表, 别名列表)"""
+    from data.plugins.astrbot_plugin_mg_guessr import initialize
+
+    rng = random.Random(seed)
+    data = make_songlist(rng, n_songs)
+    aliases = [(f"song{rng.randrange(n_songs)}", random_word(rng, 2, 8)) for _ in range(n_aliases)]
+
+    initialize.db_path = os.path.join(workdir, 'songs_db.json')
+    initialize.store_data_in_db(data, aliases)
+
+    hint_dir = os.path.join(workdir, 'image')
+    os.makedirs(hint_dir, exist_ok=True)
+    titles = [song['title_localized']['en'] for song in data['songs']]
+    for title in titles:
+        if rng.random() < hint_ratio:
+            for kind in 'ab':
+                for n in range(1, rng.randint(2, 4)):
+                    open(os.path.join(hint_dir, f"{title}-{kind}-{n}.png"), 'wb').close()
+    return initialize.db_path, titles, [alias for _, alias in aliases]
+
+
+def chatter(rng, titles, aliases):
+    """模拟群聊消息：多数是闲聊，少数是曲名、别名或曲名片段"""
+    roll = rng.random()
+    if roll < 0.55:
+        return ' '.join(random_word(rng, 1, 8) for _ in range(rng.randint(1, 12)))
+    if roll < 0.65:
+        return rng.choice(['lol', '草', '哈哈哈哈', '?', '好难', '+1', '[图片]'])
+    if roll < 0.80:
+        title = rng.choice(titles)
+        start = rng.randrange(len(title))
+        return title[start:start + rng.randint(3, 12)]
+    if roll < 0.90:
+        return rng.choice(aliases) if aliases else rng.choice(titles)
+    return rng.choice(titles).lower()
+
+
+def wchar():
+    # /proc/self/io 的 wchar 统计本进程写入的字节数（含页缓存），仅 Linux 可用
+    try:
+        with open('/proc/self/io') as f:
+            for line in f:
+                if line.startswith('wchar:'):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+
+class Recorder:
+    def __init__(self):
+        self.samples = {}
+
+    def time(self, op, func, *args):
+        start = time.perf_counter_ns()
+        result = func(*args)
+        self.samples.setdefault(op, []).append(time.perf_counter_ns() - start)
+        return result
+
+    def report(self, elapsed):
+        rows = {}
+        for op, samples in sorted(self.samples.items()):
+            samples.sort()
+            rows[op] = {
+                'count': len(samples),
+                'ops_per_sec': len(samples) / (sum(samples) / 1e9) if sum(samples) else 0.0,
+                'p50_us': samples[len(samples) // 2] / 1000,
+                'p99_us': samples[min(len(samples) - 1, int(len(samples) * 0.99))] / 1000,
+            }
+        total = sum(len(s) for s in self.samples.values())
+        return {'operations': rows, 'total_ops': total, 'wall_seconds': elapsed,
+                'throughput': total / elapsed if elapsed else 0.0}
+
+
+def run(args):
+    install_stubs()
+    from data.plugins.astrbot_plugin_mg_guessr.main import GameManager
+    from data.plugins.astrbot_plugin_mg_guessr.throttle import ChatThrottle
+
+    workdir = args.workdir or tempfile.mkdtemp(prefix='mg-guessr-bench-')
+    os.makedirs(workdir, exist_ok=True)
+    rng = random.Random(args.seed)
+    rec = Recorder()
+
+    db_path, titles, aliases = rec.time('import_catalog', make_catalog, workdir, args.songs,
+                                        args.aliases, args.hint_ratio, args.seed)
+    manager = rec.time('load_manager', GameManager, db_path, workdir, args.backend, args.shared)
+    groups = [str(100000 + i) for i in range(args.groups)]
+    throttle = ChatThrottle(args.chat_rate, args.chat_burst, args.coalesce)
+    dropped = {}
+
+    written_before = wchar()
+    start = time.perf_counter()
+    for i in range(args.messages):
+        group_id = rng.choice(groups)
+        user = f"user{rng.randrange(args.groups * 20)}"
+        if not manager.has_game(group_id):
+            rec.time('start', manager.start_game, group_id, 5)
+            continue
+        roll = rng.random()
+        if roll < args.chatter_ratio:
+            text = chatter(rng, titles, aliases)
+
+            def on_message():
+                # 与 MyPlugin.handle_all_messages 相同的路径
+                if not manager.catalog.is_plausible(text):
+                    return None
+                reason = throttle.check(group_id, text)
+                if reason:
+                    dropped[reason] = dropped.get(reason, 0) + 1
+                    return None
+                return manager.handle_non_command_guess(group_id, user, text)
+            rec.time('chat', on_message)
+        elif roll < args.chatter_ratio + 0.06:
+            rec.time('guess', manager.handle_guess, group_id, user, chatter(rng, titles, aliases))
+        elif roll < args.chatter_ratio + 0.08:
+            rec.time('tip', manager.get_hint, group_id)
+        elif roll < args.chatter_ratio + 0.09:
+            rec.time('rank', manager.get_leaderboard, group_id, 10)
+        else:
+            game = manager.games.get(group_id)
+            if game:
+                rec.time('guess', manager.handle_guess, group_id, user, game.answer_title)
+        if i % args.flush_every == 0:
+            rec.time('flush', manager.flush)
+    rec.time('close', manager.close)
+    elapsed = time.perf_counter() - start
+    written_after = wchar()
+
+    report = rec.report(elapsed)
+    report['config'] = vars(args) | {'workdir': workdir}
+    report['disk_bytes_written'] = (written_after - written_before
+                                    if written_before is not None and written_after is not None else None)
+    report['chat_dropped'] = dropped
+    if hasattr(manager, 'resolve_cache'):
+        report['resolve_cache'] = manager.resolve_cache.stats()
+    return report
+
+
+def print_report(report):
+    print(f"{'operation':<16}{'count':>10}{'ops/s':>14}{'p50 us':>12}{'p99 us':>12}")
+    for op, row in report['operations'].items():
+        print(f"{op:<16}{row['count']:>10}{row['ops_per_sec']:>14.0f}{row['p50_us']:>12.1f}{row['p99_us']:>12.1f}")
+    print(f"total {report['total_ops']} ops in {report['wall_seconds']:.2f}s "
+          f"({report['throughput']:.0f} ops/s)")
+    if report['disk_bytes_written'] is not None:
+        print(f"disk bytes written: {report['disk_bytes_written']}")
+    if report.get('chat_dropped'):
+        print(f"chat dropped: {report['chat_dropped']}")
+    if 'resolve_cache' in report:
+        print(f"resolve cache: {report['resolve_cache']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--songs', type=int, default=1000, help='曲目数量')
+    parser.add_argument('--aliases', type=int, default=4000, help='别名数量')
+    parser.add_argument('--hint-ratio', type=float, default=0.6, help='有提示图片的曲目比例')
+    parser.add_argument('--groups', type=int, default=100, help='群数量')
+    parser.add_argument('--messages', type=int, default=20000, help='回放的消息数量')
+    parser.add_argument('--chatter-ratio', type=float, default=0.85, help='普通聊天消息的比例')
+    parser.add_argument('--flush-every', type=int, default=500, help='每多少条消息刷盘一次')
+    parser.add_argument('--chat-rate', type=float, default=0, help='每个群的闲聊猜测速率上限（条/秒），0 表示不限流')
+    parser.add_argument('--chat-burst', type=int, default=10, help='闲聊猜测令牌桶容量')
+    parser.add_argument('--coalesce', type=float, default=0, help='重复猜测合并窗口（秒），0 表示不合并')
+    parser.add_argument('--backend', default='tinydb', choices=['tinydb', 'sqlite'], help='存储后端')
+    parser.add_argument('--shared', action='store_true', help='多进程共享模式（每次修改立即写入并做版本检查）')
+    parser.add_argument('--seed', type=int, default=0, help='随机种子，相同种子可复现同一组数据与流量')
+    parser.add_argument('--workdir', help='数据目录，默认使用临时目录')
+    parser.add_argument('--json', help='把结果写入 JSON 文件')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.ERROR)
+    report = run(args)
+    print_report(report)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,263 @@
+import heapq
+import os
+import pickle
+import re
+import threading
+from collections import OrderedDict
+from tinydb import TinyDB
+from astrbot.api import logger
+from data.plugins.astrbot_plugin_mg_guessr.feedback import build_vector
+
+
+# 模糊匹配的最低 Dice 相似度，子串命中不受此限制
+FUZZY_MIN_SCORE = 0.5
+# 模糊匹配至少共享的 gram 数：只有一个二元组的短键（如两字别名）只能通过子串命中，
+# 否则 "ok fr"、"好白雪" 这类包含短别名的闲聊也会达到相似度阈值
+FUZZY_MIN_SHARED = 2
+# 目录快照格式版本，索引结构变化时递增，使旧快照失效
+SNAPSHOT_VERSION = 3
+
+
+def _normalize(text):
+    return text.casefold()
+
+
+def _compact(text):
+    return re.sub(r"\s+", "", text).casefold()
+
+
+def _grams(text):
+    # 二元组对中日文和英文都足够区分；单字符时退化为一元组
+    if len(text) < 2:
+        return {text} if text else set()
+    return {text[i:i + 2] for i in range(len(text) - 1)}
+
+
+def _index_prefixes(index, key, song_id):
+    # 为 key 的每个前缀（含空串）记录第一个出现的曲目，保持与原先按库内顺序匹配一致
+    for i in range(len(key) + 1):
+        index.setdefault(key[:i], song_id)
+
+
+class SongCatalog:
+    """曲目目录：启动时从 songs_db 一次性构建，猜测时只做哈希查找"""
+
+    def __init__(self, songs, aliases, version=None):
+        # 目录版本，即导入时 info 表中的哈希
+        self.version = version
+        self.songs = {}
+        # 猜错提示用的比较向量，加载时一次解析
+        self.vectors = {}
+        self._title_prefix = {}
+        self._alias_prefix = {}
+        # n-gram 倒排索引：gram -> 条目下标；条目为 (紧凑键, gram 数, 曲目 id, 是否别名, 序号)
+        self._entries = []
+        self._postings = {}
+        self._max_key_len = 0
+
+        for song in songs:
+            song_id = song['id']
+            if song_id in self.songs:
+                continue
+            self.songs[song_id] = song
+            self.vectors[song_id] = build_vector(song)
+            _index_prefixes(self._title_prefix, _normalize(song.get('曲名', '')), song_id)
+            self._index_grams(song.get('曲名', ''), song_id, False)
+
+        for alias in aliases:
+            if alias['id'] not in self.songs:
+                continue
+            _index_prefixes(self._alias_prefix, _normalize(alias.get('别名', '')), alias['id'])
+            self._index_grams(alias.get('别名', ''), alias['id'], True)
+
+    def _index_grams(self, text, song_id, is_alias):
+        key = _compact(text)
+        if not key:
+            return
+        idx = len(self._entries)
+        # 同时登记一元组，供单字符查询使用
+        grams = _grams(key)
+        self._entries.append((key, len(grams), song_id, is_alias, idx))
+        self._max_key_len = max(self._max_key_len, len(key))
+        for gram in grams | set(key):
+            self._postings.setdefault(gram, []).append(idx)
+
+    @classmethod
+    def from_db(cls, db):
+        info = db.table('info').all()
+        version = info[0].get('hash') if info else None
+        return cls(db.table('arc_data').all(), db.table('aliases').all(), version)
+
+    def to_state(self):
+        return dict(self.__dict__)
+
+    @classmethod
+    def from_state(cls, state):
+        catalog = cls.__new__(cls)
+        catalog.__dict__.update(state)
+        return catalog
+
+    def __len__(self):
+        return len(self.songs)
+
+    def get(self, song_id):
+        return self.songs.get(song_id)
+
+    def vector(self, song_id, song=None):
+        vector = self.vectors.get(song_id)
+        if vector is None and song is not None:
+            vector = build_vector(song)
+        return vector
+
+    def find_by_title(self, name):
+        song_id = self._title_prefix.get(_normalize(name))
+        return self.songs[song_id] if song_id is not None else None
+
+    def find_by_alias(self, name):
+        song_id = self._alias_prefix.get(_normalize(name))
+        return self.songs[song_id] if song_id is not None else None
+
+    def is_plausible(self, text):
+        """
+        廉价的预筛：判断一条聊天消息是否可能命中任何曲目。
+
+        前缀与子串命中要求查询的全部 gram 都在索引中，模糊命中至少需要共享一个 gram，
+        且 Dice 相似度不低于 FUZZY_MIN_SCORE 时查询长度不会超过最长键的 3 倍，
+        因此这里返回 False 的消息一定无法被解析为曲目。
+        """
+        if not text or text.startswith('/') or '\n' in text:
+            return False
+        if text.isascii() and text.isdigit() and int(text) in self.songs:
+            return True
+        query = _compact(text)
+        if not query or len(query) > 3 * self._max_key_len:
+            return False
+        return any(gram in self._postings for gram in _grams(query))
+
+    def fuzzy_search(self, name, limit=5, substring_only=False):
+        """
+        基于 n-gram 倒排索引的模糊搜索，按相似度返回前 limit 首曲目。
+
+        排序依次为：是否子串命中、Dice 相似度、曲名优先于别名、长度差、库内顺序，
+        因此同一输入总是得到相同的最佳结果。substring_only 为真时只接受子串命中。
+        """
+        query = _compact(name)
+        qgrams = _grams(query)
+        if not qgrams:
+            return []
+
+        hits = {}
+        for gram in qgrams:
+            for idx in self._postings.get(gram, ()):
+                hits[idx] = hits.get(idx, 0) + 1
+
+        best = {}
+        for idx, shared in hits.items():
+            key, size, song_id, is_alias, order = self._entries[idx]
+            contains = shared == len(qgrams) and query in key
+            score = 2 * shared / (len(qgrams) + size)
+            if not contains and (substring_only or score < FUZZY_MIN_SCORE or shared < FUZZY_MIN_SHARED):
+                continue
+            rank = (not contains, -score, is_alias, abs(len(key) - len(query)), order)
+            if song_id not in best or rank < best[song_id]:
+                best[song_id] = rank
+
+        top = heapq.nsmallest(limit, best.items(), key=lambda item: item[1])
+        return [self.songs[song_id] for song_id, _ in top]
+
+
+def _source_key(db_path):
+    st = os.stat(db_path)
+    return st.st_mtime_ns, st.st_size
+
+
+def load_catalog(db_path, snapshot_path):
+    """
+    加载曲目目录。
+
+    songs_db 未变化（mtime 与大小一致）时直接反序列化预先构建好的快照，
+    否则从 TinyDB 重新构建索引，并写入新的快照供下次启动使用。
+    """
+    source = _source_key(db_path) if os.path.exists(db_path) else None
+    try:
+        with open(snapshot_path, 'rb') as f:
+            snapshot = pickle.load(f)
+        if snapshot.get('version') == SNAPSHOT_VERSION and snapshot.get('source') == source:
+            return SongCatalog.from_state(snapshot['state'])
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logger.warning(f"目录快照无法读取，将重新构建: {e}")
+
+    db = TinyDB(db_path)
+    try:
+        catalog = SongCatalog.from_db(db)
+    finally:
+        db.close()
+
+    # 使用读取前取得的文件标记：读取期间 songs_db 被其他进程替换时，快照会与新文件不符而在下次重建，
+    # 不会把旧内容与新文件的标记配在一起
+    snapshot = {
+        'version': SNAPSHOT_VERSION,
+        'source': source,
+        'hash': catalog.version,
+        'state': catalog.to_state(),
+    }
+    tmp = f"{snapshot_path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp, 'wb') as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, snapshot_path)
+    except OSError as e:
+        logger.error(f"写入目录快照失败: {e}")
+    return catalog
+
+
+class ResolveCache:
+    """
+    猜测字符串到曲目 id 的 LRU 缓存，未命中的结果同样缓存。
+
+    条目按目录版本区分，版本变化时整体清空。
+    """
+
+    def __init__(self, maxsize=4096):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._data = OrderedDict()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, version, key):
+        """返回 (是否命中, 曲目 id 或 None)"""
+        with self._lock:
+            if version != self._version or key not in self._data:
+                self.misses += 1
+                return False, None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return True, self._data[key]
+
+    def put(self, version, key, song_id):
+        with self._lock:
+            if version != self._version:
+                self._data.clear()
+                self._version = version
+            self._data[key] = song_id
+            self._data.move_to_end(key)
+            if len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._version = None
+
+    def stats(self):
+        total = self.hits + self.misses
+        return {
+            'size': len(self._data),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / total if total else 0.0,
+        }
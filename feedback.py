@@ -0,0 +1,80 @@
+from collections import namedtuple
+
+# 只在相同时提示的关键项
+KEY_FIELDS = ('曲师', 'FTR谱师', '曲包')
+# 逐项比较是否相同的字段
+CATEGORY_FIELDS = ('难度分级', '语言', '背景', '侧')
+# 比较大小的字段
+NUMERIC_FIELDS = ('FTR难度', 'BYD难度', 'ETR难度', '版本')
+
+# 每首曲目预先解析好的比较向量：关键项、分类项、数值项及其原始文本
+SongVector = namedtuple('SongVector', ['keys', 'categories', 'numbers', 'labels'])
+
+
+def parse_d(d):
+    # 难度 "9+" 记为 9.5，未知难度 "?" 记为 0
+    if not d:
+        return None
+    try:
+        return float(d.replace('+', '.5').replace('?', '0'))
+    except ValueError:
+        return None
+
+
+def build_vector(song):
+    return SongVector(
+        tuple(song.get(f) for f in KEY_FIELDS),
+        tuple(song.get(f) for f in CATEGORY_FIELDS),
+        tuple(parse_d(song.get(f)) for f in NUMERIC_FIELDS),
+        tuple(song.get(f, 'N/A') for f in NUMERIC_FIELDS),
+    )
+
+
+def render_feedback(guess, answer):
+    """比较两首曲目的向量，生成猜错时的逐项提示"""
+    output = []
+    for field, gv, av in zip(CATEGORY_FIELDS, guess.categories, answer.categories):
+        if gv is None and av is None:
+            output.append(f"✅{field}: N/A")
+        elif gv is None:
+            output.append(f"🚫{field}: N/A")
+        elif av is None:
+            output.append(f"🚫{field}: {gv}")
+        elif gv == av:
+            output.append(f"✅{field}: {gv}")
+        else:
+            output.append(f"❌{field}: {gv}")
+
+    for field, gv, av, label in zip(NUMERIC_FIELDS, guess.numbers, answer.numbers, guess.labels):
+        if gv is not None and av is not None:
+            if gv < av:
+                output.append(f"⬆️{field}: {label}")
+            elif gv > av:
+                output.append(f"⬇️{field}: {label}")
+            else:
+                output.append(f"✅{field}: {label}")
+        elif gv is None and av is None:
+            output.append(f"✅{field}: N/A")
+        else:
+            output.append(f"🚫{field}: {label}")
+
+    key_items = [f"✅{field}: {gv}"
+                 for field, gv, av in zip(KEY_FIELDS, guess.keys, answer.keys) if gv == av]
+    if key_items:
+        output.append("\n你发现了关键项！")
+        output.extend(key_items)
+    return output
+
+
+def score_many(guess, answers):
+    """
+    批量计算一首猜测曲目与多首候选答案的吻合项数（相同的关键项、分类项与数值项之和），
+    供后续玩法筛选或排序候选答案使用。
+    """
+    scores = []
+    for answer in answers:
+        score = sum(1 for gv, av in zip(guess.keys, answer.keys) if gv == av)
+        score += sum(1 for gv, av in zip(guess.categories, answer.categories) if gv == av)
+        score += sum(1 for gv, av in zip(guess.numbers, answer.numbers) if gv == av)
+        scores.append(score)
+    return scores
@@ -0,0 +1,83 @@
+import json
+import os
+import re
+from astrbot.api import logger
+
+# 提示图片命名规则：{曲名}-a-1.png / {曲名}-b-2.png
+HINT_FILE = re.compile(r"^(.+)-(a|b)-\d+\.png$")
+
+
+class HintManifest:
+    """
+    提示图片清单（曲名 -> 提示文件列表）。
+
+    清单随目录 mtime 失效，并以旁路文件的形式保存，重启后无需重新扫描目录。
+    """
+
+    def __init__(self, hint_dir, manifest_path):
+        self.hint_dir = hint_dir
+        self.manifest_path = manifest_path
+        self._mtime = None
+        self._hints = {}
+
+    def _dir_mtime(self):
+        try:
+            return os.stat(self.hint_dir).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+
+    def _load_sidecar(self, mtime):
+        try:
+            with open(self.manifest_path, encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if data.get('mtime') != mtime:
+            return None
+        return data.get('hints', {})
+
+    def _scan(self):
+        hints = {}
+        try:
+            names = os.listdir(self.hint_dir)
+        except FileNotFoundError:
+            names = []
+        for name in names:
+            m = HINT_FILE.match(name)
+            if m:
+                hints.setdefault(m.group(1), []).append(name)
+        for files in hints.values():
+            files.sort()
+        return hints
+
+    def _save_sidecar(self, mtime, hints):
+        tmp = f"{self.manifest_path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp, 'w', encoding='utf-8') as f:
+                json.dump({'mtime': mtime, 'hints': hints}, f, ensure_ascii=False)
+            os.replace(tmp, self.manifest_path)
+        except OSError as e:
+            logger.error(f"写入提示清单失败: {e}")
+
+    def refresh(self):
+        mtime = self._dir_mtime()
+        if mtime == self._mtime:
+            return
+        hints = self._load_sidecar(mtime)
+        if hints is None:
+            hints = self._scan()
+            self._save_sidecar(mtime, hints)
+        self._hints = hints
+        self._mtime = mtime
+
+    @property
+    def version(self):
+        return self._mtime
+
+    def get(self, title):
+        self.refresh()
+        return self._hints.get(title, [])
+
+    def titles(self):
+        self.refresh()
+        return self._hints.keys()
@@ -1,49 +1,106 @@
+import asyncio
 import csv
 import json
 import hashlib
+import os
 import httpx
-from tinydb import TinyDB
 from astrbot.api import logger
+from data.plugins.astrbot_plugin_mg_guessr.storage import file_lock, write_atomic
 
 # 数据库文件路径
 db_path = '/AstrBot/data/songs_db.json'
+# HTTP 响应缓存目录，保存正文与 ETag / Last-Modified
+cache_dir = '/AstrBot/data/http_cache'
+songlist_url = "https://arcwiki.mcd.blue/index.php?title=Template:Songlist.json&action=raw"
 alias_csv_url = "https://aya.yurisaki.top/fs/export/yrsk_arcaea_alias_1744887235.csv"
 
-# 从 URL 获取 JSON 数据
-async def fetch_song_data(url):
+# 所有请求共用的连接池客户端
+_client = None
+
+def get_client():
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(30.0),
+            limits=httpx.Limits(max_connections=8, max_keepalive_connections=4),
+            follow_redirects=True,
+        )
+    return _client
+
+async def close_client():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+def _cache_paths(url):
+    key = hashlib.sha256(url.encode('utf-8')).hexdigest()[:32]
+    return os.path.join(cache_dir, f"{key}.json"), os.path.join(cache_dir, f"{key}.body")
+
+def _read_cache(url):
+    meta_path, body_path = _cache_paths(url)
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(url)  # 异步请求
-            response.raise_for_status()  # 如果返回的状态码不是2xx，会抛出异常
-            return response.json()  # 尝试将响应解析为 JSON
+        with open(meta_path, encoding='utf-8') as f:
+            meta = json.load(f)
+        with open(body_path, encoding='utf-8') as f:
+            return meta, f.read()
+    except (OSError, ValueError):
+        return {}, None
+
+def _write_cache(url, response):
+    meta_path, body_path = _cache_paths(url)
+    os.makedirs(cache_dir, exist_ok=True)
+    meta = {
+        'etag': response.headers.get('ETag'),
+        'last_modified': response.headers.get('Last-Modified'),
+    }
+    write_atomic(body_path, response.text)
+    write_atomic(meta_path, json.dumps(meta))
+
+# 带条件请求的获取：返回 (正文, 新响应)，上游未变化时服务器返回 304，直接使用本地缓存，新响应为 None。
+# 新响应不会立即写入缓存：调用方在数据成功入库后再调用 _write_cache，
+# 否则入库失败后下次请求会得到 304，这次变化就再也不会被应用
+async def fetch_cached(url, client=None):
+    client = client or get_client()
+    meta, cached = _read_cache(url)
+    headers = {}
+    if cached is not None:
+        if meta.get('etag'):
+            headers['If-None-Match'] = meta['etag']
+        if meta.get('last_modified'):
+            headers['If-Modified-Since'] = meta['last_modified']
+    try:
+        response = await client.get(url, headers=headers)  # 异步请求
+        if response.status_code == 304 and cached is not None:
+            return cached, None
+        response.raise_for_status()  # 如果返回的状态码不是2xx，会抛出异常
+        return response.text, response
     except httpx.RequestError as e:
-        logger.error(f"获取远程数据失败: {e}")  # 记录请求失败的错误
+        logger.error(f"获取远程数据失败: {url} {e}")  # 记录请求失败的错误
     except httpx.HTTPStatusError as e:
         logger.error(f"HTTP 错误: {e}")  # 记录 HTTP 错误
+    # 请求失败时退回到上一次的缓存
+    return cached, None
+
+# 解析曲目 JSON 数据
+def parse_song_data(text):
+    try:
+        return json.loads(text)
     except ValueError as e:
         logger.error(f"响应内容不是有效的 JSON 格式: {e}")  # 记录 JSON 解析错误
     return None  # 返回 None 表示失败
 
-# 从 CSV 获取别名数据
-async def fetch_aliases():
+# 解析别名 CSV 数据
+def parse_aliases(text):
     try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(alias_csv_url)
-            response.raise_for_status()
-            csv_content = response.text
-            # 解析 CSV 数据
-            aliases = []
-            reader = csv.reader(csv_content.splitlines(), delimiter=',')
-            for row in reader:
-                if len(row) > 3:
-                    song_id = row[1]
-                    alias = row[3]
-                    aliases.append((song_id, alias))
-            return aliases
-    except httpx.RequestError as e:
-        logger.error(f"获取别名数据失败: {e}")
-    except httpx.HTTPStatusError as e:
-        logger.error(f"HTTP 错误: {e}")
+        aliases = []
+        reader = csv.reader(text.splitlines(), delimiter=',')
+        for row in reader:
+            if len(row) > 3:
+                song_id = row[1]
+                alias = row[3]
+                aliases.append((song_id, alias))
+        return aliases
     except Exception as e:
         logger.error(f"解析 CSV 文件时发生错误: {e}")
     return []
@@ -53,113 +110,190 @@ def calculate_hash(data):
     json_str = json.dumps(data, sort_keys=True)
     return hashlib.sha256(json_str.encode('utf-8')).hexdigest()
 
-# 存储数据到数据库
+# 获取曲目难度的函数：考虑ratingPlus
+def get_rating(diff):
+    rating = diff.get('rating', 0)
+    # 检查是否存在 ratingPlus 且为 True，若是，则加上 "+"
+    if 'ratingPlus' in diff and diff['ratingPlus'] is True:
+        return f"{rating}+"
+    return str(rating)
+
+# 将 songlist 中的一首曲目解析为 arc_data 表的一行
+def parse_song(song):
+    return {
+        '曲名': song['title_localized'].get('en', ''),
+        '语言': ' '.join([lang for lang in song['title_localized'].keys()]),
+        '曲包': song['set'],
+        '曲师': song['artist'],
+        '难度分级': ' '.join(
+            [
+                "PST" if diff.get('ratingClass') == 0 else
+                "PRS" if diff.get('ratingClass') == 1 else
+                "FTR" if diff.get('ratingClass') == 2 else
+                "BYD" if diff.get('ratingClass') == 3 else
+                "ETR" if diff.get('ratingClass') == 4 else ""
+                for diff in song.get('difficulties', [])
+            ]
+        ),
+        'FTR谱师': next((diff.get('chartDesigner', '') for diff in song.get('difficulties', []) if diff.get('ratingClass') == 2), ''),
+        '侧': '光芒侧' if song.get('side') == 0 else
+              '纷争侧' if song.get('side') == 1 else
+              '消色之侧' if song.get('side') == 2 else
+              'Lephon侧',
+        '背景': song.get('bg', ''),
+        '版本': song.get('version', ''),
+        'FTR难度': next((get_rating(diff) for diff in song.get('difficulties', []) if diff.get('ratingClass') == 2), ''),
+        'BYD难度': next((get_rating(diff) for diff in song.get('difficulties', []) if diff.get('ratingClass') == 3), ''),
+        'ETR难度': next((get_rating(diff) for diff in song.get('difficulties', []) if diff.get('ratingClass') == 4), ''),
+        'id': song['id']  # 添加曲目的 id
+    }
+
+# 读取 TinyDB 文件的全部表
+def read_db(path):
+    try:
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+# 一次写回整个 TinyDB 文件；与 TinyDB 自身的输出一样转义非 ASCII 字符，
+# TinyDB 以系统默认编码读取文件，非 UTF-8 环境下也能正常加载
+def write_db(path, tables):
+    write_atomic(path, json.dumps(tables))
+
+# 按 TinyDB 的格式把行列表转为表（文档 id 从 1 开始）
+def as_table(rows):
+    return {str(doc_id): row for doc_id, row in enumerate(rows, start=1)}
+
+# 表中下一个可用的文档 id
+def next_doc_id(table):
+    return max((int(doc_id) for doc_id in table), default=0) + 1
+
+# 按文档 id 排序，保持 TinyDB 的遍历顺序
+def sort_table(table):
+    return dict(sorted(table.items(), key=lambda item: int(item[0])))
+
+# 存储数据到数据库，返回数据库是否与传入数据一致（已写入或本来就相同）；
+# 多个进程共用数据目录时用文件锁串行写入，后拿到锁的进程会发现哈希未变化而跳过
 def store_data_in_db(data, aliases):
+    with file_lock(db_path + '.lock'):
+        return _store_data_in_db(data, aliases)
+
+def _store_data_in_db(data, aliases):
     if not data:
         logger.error("没有有效的曲目信息，跳过存储。")
-        return
-
-    # 创建数据库实例
-    db = TinyDB(db_path)
+        return False
 
-    # 获取 info 表、arc_data 表和 alias 表
-    info_table = db.table('info')
-    arc_data_table = db.table('arc_data')
-    alias_table = db.table('aliases')
+    tables = read_db(db_path)
 
-    # 获取当前数据的哈希值
-    current_hash = calculate_hash(data)
+    # 获取当前数据的哈希值（曲目与别名一起计算，只有别名变化时也要进入对比流程）
+    current_hash = calculate_hash({'songs': data, 'aliases': [list(pair) for pair in aliases]})
 
     # 查找 info 表中的哈希值
-    info = info_table.all()
+    info = list(tables.get('info', {}).values())
     if info and info[0].get('hash') == current_hash:
         logger.info("数据未变化，跳过执行。")
-        db.close()
-        return
-
-    # 清空 arc_data 表并存储新数据
-    logger.info("数据变化，正在清空 arc_data 表并存储新数据...")
-    arc_data_table.truncate()
-    alias_table.truncate()
-
-    # 获取曲目难度的函数：考虑ratingPlus
-    def get_rating(diff):
-        rating = diff.get('rating', 0)
-        # 检查是否存在 ratingPlus 且为 True，若是，则加上 "+"
-        if 'ratingPlus' in diff and diff['ratingPlus'] is True:
-            return f"{rating}+"
-        return str(rating)
-
-    # 解析每个曲目信息并插入到 arc_data 表
+        return True
+
+    logger.info("数据变化，正在对比 arc_data 表和 aliases 表...")
+
+    # 一次遍历按曲目 id 分组别名
+    aliases_by_id = {}
+    for song_alias, alias_name in aliases:
+        aliases_by_id.setdefault(song_alias, []).append(alias_name)
+
+    old_songs = tables.get('arc_data', {})
+    old_song_docs = {row['id']: doc_id for doc_id, row in old_songs.items()}
+    old_hashes = {row['id']: row['hash'] for row in tables.get('song_hashes', {}).values()}
+    next_song_doc = next_doc_id(old_songs)
+
+    songs = {}
+    seen = set()
+    song_hashes = []
+    alias_pairs = []
+    added = updated = 0
+    # 逐首对比曲目哈希，只解析新增或有变化的曲目，未变化的行原样保留
     for song in data.get('songs', []):
         try:
-            # 获取曲目的 id
-            song_id = song['id']
-
             if 'title_localized' not in song or not isinstance(song['title_localized'], dict):
                 continue
-
-            song_data = {
-                '曲名': song['title_localized'].get('en', ''),
-                '语言': ' '.join([lang for lang in song['title_localized'].keys()]),
-                '曲包': song['set'],
-                '曲师': song['artist'],
-                '难度分级': ' '.join(
-                    [
-                        "PST" if diff.get('ratingClass') == 0 else
-                        "PRS" if diff.get('ratingClass') == 1 else
-                        "FTR" if diff.get('ratingClass') == 2 else
-                        "BYD" if diff.get('ratingClass') == 3 else
-                        "ETR" if diff.get('ratingClass') == 4 else ""
-                        for diff in song.get('difficulties', [])
-                    ]
-                ),
-                'FTR谱师': next((diff.get('chartDesigner', '') for diff in song.get('difficulties', []) if diff.get('ratingClass') == 2), ''),
-                '侧': '光芒侧' if song.get('side') == 0 else
-                      '纷争侧' if song.get('side') == 1 else
-                      '消色之侧' if song.get('side') == 2 else
-                      'Lephon侧',
-                '背景': song.get('bg', ''),
-                '版本': song.get('version', ''),
-                'FTR难度': next((get_rating(diff) for diff in song.get('difficulties', []) if diff.get('ratingClass') == 2), ''),
-                'BYD难度': next((get_rating(diff) for diff in song.get('difficulties', []) if diff.get('ratingClass') == 3), ''),
-                'ETR难度': next((get_rating(diff) for diff in song.get('difficulties', []) if diff.get('ratingClass') == 4), ''),
-                'id': song_id  # 添加曲目的 id
-            }
-            arc_data_table.insert(song_data)
-
+            song_id = song['id']
+            if song_id in seen:
+                continue
+            seen.add(song_id)
+            song_hash = calculate_hash(song)
+            doc_id = old_song_docs.get(song_id)
+            if doc_id is None:
+                doc_id = str(next_song_doc)
+                next_song_doc += 1
+                songs[doc_id] = parse_song(song)
+                added += 1
+            elif old_hashes.get(song_id) != song_hash:
+                songs[doc_id] = parse_song(song)
+                updated += 1
+            else:
+                songs[doc_id] = old_songs[doc_id]
+            song_hashes.append({'id': song_id, 'hash': song_hash})
             # 存储别名到别名表
-            for alias in aliases:
-                song_alias, alias_name = alias
-                if song_alias == song_id:  # 匹配到曲目的 ID
-                    alias_table.insert({
-                        'id': song_alias,
-                        '别名': alias_name
-                    })
+            for alias_name in aliases_by_id.get(song_id, []):
+                alias_pairs.append((song_id, alias_name))
 
         except Exception as e:
             # 如果某个曲目出错，打印错误信息并跳过该曲目
             logger.error(f"处理曲目 {song.get('title_localized', {}).get('en', '未知')} 时发生错误: {e}")
             continue
+    removed = len(old_songs) - (len(songs) - added)
+
+    # 别名按 (曲目 id, 别名) 对比，保留未变化的文档 id
+    old_aliases = tables.get('aliases', {})
+    old_alias_docs = {(row['id'], row['别名']): doc_id for doc_id, row in old_aliases.items()}
+    next_alias_doc = next_doc_id(old_aliases)
+    alias_rows = {}
+    for pair in alias_pairs:
+        doc_id = old_alias_docs.get(pair)
+        if doc_id is None:
+            doc_id = str(next_alias_doc)
+            next_alias_doc += 1
+        alias_rows[doc_id] = {'id': pair[0], '别名': pair[1]}
+    aliases_added = next_alias_doc - next_doc_id(old_aliases)
+    aliases_removed = len(old_aliases) - (len(alias_rows) - aliases_added)
+
+    tables['arc_data'] = sort_table(songs)
+    tables['aliases'] = sort_table(alias_rows)
+    tables['song_hashes'] = as_table(song_hashes)
+    tables['info'] = as_table([{'hash': current_hash}])
+    write_db(db_path, tables)
+    logger.info(
+        f"曲目新增 {added}、更新 {updated}、删除 {removed}；"
+        f"别名新增 {aliases_added}、删除 {aliases_removed}"
+    )
+    return True
+
+# 初始化数据函数，返回数据库是否有更新
+async def initialize_data(song_url=songlist_url, alias_url=alias_csv_url):
+    # 并发获取曲目信息和别名数据
+    (song_text, song_response), (alias_text, alias_response) = await asyncio.gather(
+        fetch_cached(song_url), fetch_cached(alias_url)
+    )
+
+    if song_text is None:
+        logger.error("无法获取有效的曲目信息，初始化失败。")
+        return False
+    if song_response is None and alias_response is None and os.path.exists(db_path):
+        logger.info("远程数据未变化，跳过解析。")
+        return False
 
-    # 更新 info 表中的哈希值
-    info_table.truncate()  # 清空 info 表
-    info_table.insert({'hash': current_hash})
-
-    # 关闭数据库
-    db.close()
-
-# 初始化数据函数
-async def initialize_data():
-    url = "https://arcwiki.mcd.blue/index.php?title=Template:Songlist.json&action=raw"
-    # 异步获取曲目信息
-    song_data = await fetch_song_data(url)
-    
-    if song_data:
-        # 获取别名数据
-        aliases = await fetch_aliases()
-        # 存储数据到数据库
-        store_data_in_db(song_data, aliases)
-        logger.info("数据初始化并存储成功。")
-    else:
+    song_data = parse_song_data(song_text)
+    if not song_data:
         logger.error("无法获取有效的曲目信息，初始化失败。")
+        return False
+    aliases = parse_aliases(alias_text) if alias_text else []
+    # 存储数据到数据库（阻塞的文件写入放到线程中执行）
+    if not await asyncio.to_thread(store_data_in_db, song_data, aliases):
+        return False
+    # 入库成功后才保存正文与 ETag / Last-Modified，失败时下次刷新会重新获取并再次入库
+    for url, response in ((song_url, song_response), (alias_url, alias_response)):
+        if response is not None:
+            await asyncio.to_thread(_write_cache, url, response)
+    logger.info("数据初始化并存储成功。")
+    return True
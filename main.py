@@ -1,236 +1,421 @@
-from astrbot.api.event import filter, AstrMessageEvent, MessageEventResult
+from astrbot.api.event import filter, AstrMessageEvent, MessageEventResult, MessageChain
 from astrbot.api.star import Context, Star, register
-from astrbot.api import logger
+from astrbot.api import logger, AstrBotConfig
 import astrbot.api.message_components as Comp
-from data.plugins.astrbot_plugin_mg_guessr.initialize import initialize_data
-from tinydb import TinyDB, Query
-from datetime import datetime
+from data.plugins.astrbot_plugin_mg_guessr.initialize import initialize_data, close_client
+from data.plugins.astrbot_plugin_mg_guessr.catalog import load_catalog, ResolveCache
+from data.plugins.astrbot_plugin_mg_guessr.hints import HintManifest
+from data.plugins.astrbot_plugin_mg_guessr.storage import open_storage, file_lock, ConflictError
+from data.plugins.astrbot_plugin_mg_guessr.state import GameState
+from data.plugins.astrbot_plugin_mg_guessr.feedback import render_feedback
+from data.plugins.astrbot_plugin_mg_guessr.metrics import metrics
+from data.plugins.astrbot_plugin_mg_guessr.throttle import ChatThrottle
+from tinydb import TinyDB
+from concurrent.futures import ThreadPoolExecutor
+import asyncio
+import functools
+from collections import deque
 import random
-import re
+import threading
+import time
 import os
 
+# 对局写后存储的刷盘间隔（秒）
+FLUSH_INTERVAL = 5
+# 执行阻塞存储与文件操作的线程数
+IO_WORKERS = 4
+# 闲置对局的检查间隔（秒）
+SWEEP_INTERVAL = 60
+# 每个会话避免重复出题的最近答案数
+RECENT_ANSWERS = 20
+# 会话超过该时间（秒）没有开新局，不再保留其最近答案
+RECENT_TTL = 6 * 3600
+# 会话锁的分段数：会话按哈希共用固定数量的锁，内存不随历史会话数增长
+LOCK_STRIPES = 256
+# 共享模式下对局版本冲突时的最大重试次数
+CONFLICT_RETRIES = 3
+# 超过该时间（秒）没有消息的会话，清理其限流状态
+THROTTLE_IDLE = 600
+# 共享模式下检查其他进程修改的间隔（秒）
+SHARED_POLL_INTERVAL = 1
+
+def _session_locked(method):
+    # 同一会话内的对局修改串行执行，不同会话只在哈希到同一分段锁时才会短暂互相等待；
+    # 共享模式下若这局已被其他进程修改，丢弃本地副本后按最新状态重试
+    @functools.wraps(method)
+    def wrapper(self, group_id, *args, **kwargs):
+        with self._session_lock(group_id):
+            for _ in range(CONFLICT_RETRIES):
+                try:
+                    return method(self, group_id, *args, **kwargs)
+                except ConflictError:
+                    metrics.incr('game_conflict')
+                    self.games.pop(group_id, None)
+            return "其他实例正在修改这局游戏，请稍后重试"
+    return wrapper
+
+def _file_stamp(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
 class GameManager:
-    def __init__(self, db_path):
-        self.songs_db = TinyDB(db_path)
-        self.games_db = self.songs_db.table('games')
-        self.winners_db = TinyDB('/AstrBot/data/winners.json')
-        self.group_settings_db = self.songs_db.table('group_settings')
+    def __init__(self, db_path, data_dir='/AstrBot/data', backend='tinydb', shared=False):
+        self.db_path = db_path
+        self.data_dir = data_dir
+        # 共享模式：多个进程共用同一数据目录，对局状态以共享存储为准，本地只是缓存
+        self.shared = shared
+        self.snapshot_path = os.path.join(data_dir, 'catalog.pickle')
+        self._catalog_stamp = _file_stamp(db_path)
+        self.catalog = load_catalog(db_path, self.snapshot_path)
+        self.resolve_cache = ResolveCache()
+        self.hint_dir = os.path.join(data_dir, 'image')
+        self.hints = HintManifest(self.hint_dir, os.path.join(data_dir, 'hint_manifest.json'))
+        self.storage = open_storage(data_dir, backend, shared)
+        self.game_store = self.storage.games
+        self.cold_games = self.storage.cold_games
+        self.winners = self.storage.winners
+        self.group_settings = self.storage.group_settings
+        # TinyDB 只在首次迁移旧数据时才会真正读取 songs_db；迁移会改写 songs_db，与数据刷新共用文件锁
+        with file_lock(db_path + '.lock'):
+            songs_db = TinyDB(db_path)
+            self._migrate_games(songs_db)
+            self._migrate_group_settings(songs_db)
+            songs_db.close()
         self.games = self._load_games()
+        self._locks = [threading.RLock() for _ in range(LOCK_STRIPES)]
+        self._pool = (None, [])
+        # 会话 id -> (最近答案队列, 最近一次出题时间)
+        self._recent = {}
+        self._last_sweep = time.time()
+
+    def _migrate_games(self, songs_db):
+        # 旧版本把对局存放在 songs_db 的 games 表中，首次启动时迁移到独立存储
+        if self.game_store.exists():
+            return
+        legacy = songs_db.table('games')
+        for record in legacy.all():
+            self.game_store.put(record['group_id'], record)
+        self.game_store.close()
+        legacy.truncate()
+
+    def _migrate_group_settings(self, songs_db):
+        # 旧版本把群设置存放在 songs_db 的 group_settings 表中
+        if self.group_settings.exists():
+            return
+        for record in songs_db.table('group_settings').all():
+            self.group_settings.set_enabled(record['group_id'], record.get('enabled'))
+        self.group_settings.flush(force=True)
 
     def _load_games(self):
         games = {}
-        for record in self.games_db.all():
-            group_id = record['group_id']
-            answer = self._get_song_by_id(record['answer']['id'])
-            if not answer:
-                continue
-            games[group_id] = {
-                'answer': answer,
-                'max_attempts': record['max_attempts'],
-                'remaining': record['remaining'],
-                'start_time': datetime.fromisoformat(record['start_time']),
-                'guesses': record['guesses'],
-                'hints_used': set(record['hints_used'])
-            }
+        for group_id, record in self.game_store.all().items():
+            game = GameState.from_record(record, self.catalog)
+            if game:
+                games[group_id] = game
         return games
 
+    def catalog_outdated(self):
+        # 多个进程共用数据目录时，songs_db 可能已由其他进程更新
+        return _file_stamp(self.db_path) != self._catalog_stamp
+
+    def reload_catalog(self):
+        # 在调用线程中构建新目录，完成后一次赋值替换；进行中的猜测仍使用旧目录
+        self._catalog_stamp = _file_stamp(self.db_path)
+        catalog = load_catalog(self.db_path, self.snapshot_path)
+        self.catalog = catalog
+        self.resolve_cache.clear()
+        logger.info(f"曲目目录已更新，共 {len(catalog)} 首")
+
+    def _session_lock(self, group_id):
+        return self._locks[hash(group_id) % LOCK_STRIPES]
+
+    def poll_shared(self):
+        # 共享模式下定期在线程池中调用，刷新事件循环直接读取的对局与群设置快照
+        self.game_store.refresh()
+        self.group_settings.refresh()
+
+    def has_game(self, group_id):
+        if self.shared:
+            # 只读取内存快照，不访问数据库
+            return group_id in self.game_store or group_id in self.cold_games
+        return group_id in self.games or group_id in self.cold_games
+
+    def _get_game(self, group_id):
+        if self.shared and self.game_store.is_stale(group_id):
+            # 这局已被其他进程修改或结束，丢弃本地副本
+            self.games.pop(group_id, None)
+        game = self.games.get(group_id)
+        if game is None and self.shared:
+            record = self.game_store.get(group_id)
+            game = GameState.from_record(record, self.catalog) if record else None
+            if game:
+                self.games[group_id] = game
+        # 冷对局在该会话下一次有消息时载回内存
+        if game is None and group_id in self.cold_games:
+            record = self.cold_games.pop(group_id)
+            game = GameState.from_record(record, self.catalog) if record else None
+            if game:
+                self.games[group_id] = game
+                self._save_game(group_id)
+        return game
+
+    def sweep(self, idle_ttl, cold_after):
+        """
+        清理闲置对局：超过 idle_ttl 秒无人操作的对局直接结束，
+        超过 cold_after 秒的对局移出内存转为冷对局。返回 [(会话 id, 结束提示, 消息来源), ...]。
+        """
+        self._prune_recent()
+        if self.shared:
+            return self._sweep_shared(idle_ttl, cold_after)
+        now = time.time()
+        expired = []
+        for group_id in list(self.games):
+            with self._session_lock(group_id):
+                game = self.games.get(group_id)
+                if not game:
+                    continue
+                idle = now - game.last_active
+                if idle_ttl and idle >= idle_ttl:
+                    self.games.pop(group_id)
+                    self.game_store.delete(group_id)
+                    expired.append((group_id, self._expired_result(game), game.origin))
+                elif cold_after and idle >= cold_after:
+                    self.cold_games.put(group_id, game.to_record(), game.last_active)
+                    self.games.pop(group_id)
+                    self.game_store.delete(group_id)
+        if idle_ttl:
+            for group_id in self.cold_games.idle_ids(idle_ttl):
+                with self._session_lock(group_id):
+                    record = self.cold_games.pop(group_id)
+                    game = GameState.from_record(record, self.catalog) if record else None
+                    if game:
+                        expired.append((group_id, self._expired_result(game), game.origin))
+        return expired
+
+    def _prune_recent(self):
+        # 只清理没有进行中对局、且长时间没有开新局的会话
+        deadline = time.time() - RECENT_TTL
+        for group_id, (_, used) in list(self._recent.items()):
+            if used < deadline and not self.has_game(group_id):
+                self._recent.pop(group_id, None)
+
+    def _sweep_shared(self, idle_ttl, cold_after):
+        # 共享模式下对局始终在共享存储中，转冷只需丢弃本地副本；
+        # 超时结束以版本检查删除，多个进程同时清理时只有一个会公布答案
+        now = time.time()
+        since, self._last_sweep = self._last_sweep, now
+        expired = []
+        group_ids = set(self.games)
+        if idle_ttl:
+            group_ids.update(self.game_store.idle_ids(idle_ttl))
+        for group_id in group_ids:
+            with self._session_lock(group_id):
+                try:
+                    game = self._get_game(group_id)
+                    if not game:
+                        continue
+                    idle = now - game.last_active
+                    if idle_ttl and idle >= idle_ttl:
+                        self.game_store.delete(group_id)
+                        self.games.pop(group_id, None)
+                        expired.append((group_id, self._expired_result(game), game.origin))
+                    elif cold_after and idle >= cold_after:
+                        self.games.pop(group_id, None)
+                    elif game.last_active > since:
+                        # 群内闲聊猜测只更新本地的最后活跃时间，定期写回，避免被其他进程误判为闲置
+                        self._save_game(group_id)
+                except ConflictError:
+                    self.games.pop(group_id, None)
+        return expired
+
+    def _expired_result(self, game):
+        text = f"游戏长时间无人操作，已自动结束。正确答案是：{game.answer_title}"
+        art = self._get_artwork_path(game.answer_id)
+        if art:
+            return text, art
+        return text
+
     def is_group_enabled(self, group_id):
-        record = self.group_settings_db.get(Query().group_id == int(group_id))
-        return bool(record and record.get("enabled"))
+        return self.group_settings.is_enabled(group_id)
 
     def enable_group(self, group_id):
-        self.group_settings_db.upsert({'group_id': group_id, 'enabled': True}, Query().group_id == int(group_id))
-        
+        self.group_settings.set_enabled(group_id, True)
 
     def disable_group(self, group_id):
-        self.group_settings_db.upsert({'group_id': group_id, 'enabled': False}, Query().group_id == int(group_id))
+        self.group_settings.set_enabled(group_id, False)
 
+    @metrics.timed('save_game')
     def _save_game(self, group_id):
-        if group_id in self.games:
-            game = self.games[group_id]
-            self.games_db.upsert({
-                'group_id': group_id,
-                'answer': {'id': game['answer']['id']},
-                'max_attempts': game['max_attempts'],
-                'remaining': game['remaining'],
-                'start_time': game['start_time'].isoformat(),
-                'guesses': game['guesses'],
-                'hints_used': list(game['hints_used'])
-            }, Query().group_id == group_id)
-
-    def _get_song_by_id(self, song_id):
-        ArcData = Query()
-        return self.songs_db.table('arc_data').get(ArcData.id == song_id)
-
-    def _find_song_by_alias(self, name):
-        Aliases = Query()
-        alias = self.songs_db.table('aliases').get(
-            Aliases.别名.matches(f'^{re.escape(name)}', flags=re.IGNORECASE)
-        )
-        return self._get_song_by_id(alias['id']) if alias else None
+        game = self.games.get(group_id)
+        if game:
+            self.game_store.put(group_id, game.to_record(), game.last_active)
 
-    def _exact_song_name(self, name):
-        ArcData = Query()
-        return self.songs_db.table('arc_data').get(
-            ArcData.曲名.matches(f'^{re.escape(name)}', flags=re.IGNORECASE)
-        )
+    def flush(self):
+        self.storage.flush()
 
-    def _fuzzy_search(self, name):
-        esc = re.sub(r"\s+", "", name)
-        pattern = re.compile(rf"(?i).*{re.escape(esc)}.*")
-        return [s for s in self.songs_db.table('arc_data').all()
-                if pattern.match(re.sub(r"\s+", "", s.get('曲名', '')))]
+    def close(self):
+        self.storage.close()
+
+    def _answer(self, game):
+        # 答案曲目可能在目录热更新后被移除，此时只保留 id 与曲名
+        return self.catalog.get(game.answer_id) or {'id': game.answer_id, '曲名': game.answer_title}
+
+    def _answer_vector(self, game):
+        return self.catalog.vector(game.answer_id, self._answer(game))
 
     def _get_artwork_path(self, song_id):
-        path = f"/AstrBot/data/songs/dl_{song_id}/1080_base_256.jpg"
+        path = os.path.join(self.data_dir, 'songs', f"dl_{song_id}", '1080_base_256.jpg')
         return path if os.path.isfile(path) else None
 
-    def start_game(self, group_id, max_attempts=5):
+    def _answer_pool(self):
+        # 有提示图片的曲目才能作为答案；目录或提示目录变化时重新计算
+        # 以目录对象本身（而非 id）比较：旧目录释放后其地址可能被新目录复用
+        self.hints.refresh()
+        catalog = self.catalog
+        key = (catalog, self.hints.version)
+        cached_key, pool = self._pool
+        if cached_key is None or cached_key[0] is not catalog or cached_key[1] != key[1]:
+            titles = self.hints.titles()
+            pool = [song_id for song_id, song in catalog.songs.items() if song.get('曲名') in titles]
+            self._pool = (key, pool)
+        return pool
+
+    def _pick_answer(self, group_id):
+        pool = self._answer_pool()
+        if not pool:
+            return None
+        recent = self._recent.get(group_id, (None,))[0]
+        if recent is None:
+            recent = deque(maxlen=RECENT_ANSWERS)
+        self._recent[group_id] = (recent, time.time())
+        answer_id = None
+        if len(pool) > len(recent):
+            for _ in range(8):
+                candidate = random.choice(pool)
+                if candidate not in recent:
+                    answer_id = candidate
+                    break
+            else:
+                answer_id = random.choice([x for x in pool if x not in recent])
+        else:
+            answer_id = random.choice(pool)
+        recent.append(answer_id)
+        return self.catalog.get(answer_id)
+
+    @metrics.timed('start_game')
+    @_session_locked
+    def start_game(self, group_id, max_attempts=5, origin=None):
         try:
             max_attempts = int(max_attempts)
         except ValueError:
             return "尝试次数必须为数字"
         if not (1 <= max_attempts <= 20):
             return "尝试次数必须在1到20之间"
-        info = "已重新创建游戏，" if group_id in self.games else ""
-
-        hint_dir = "/AstrBot/data/image/"
-        songs = self.songs_db.table('arc_data').all()
-        answer = None
-        for _ in range(100):
-            candidate = random.choice(songs)
-            pattern = re.compile(rf"^{re.escape(candidate['曲名'])}-(a|b)-\d+\.png$")
-            if any(pattern.match(f) for f in os.listdir(hint_dir)):
-                answer = candidate
-                break
+        info = "已重新创建游戏，" if self.has_game(group_id) else ""
+        if self.shared:
+            # 先读取当前版本号，覆盖其他进程创建的对局时才能通过版本检查
+            self._get_game(group_id)
+
+        answer = self._pick_answer(group_id)
         if not answer:
             return "未能为本局找到可用提示，稍后再试"
 
-        logger.warning(f"游戏开始，答案是：{answer['曲名']}")
-        self.games[group_id] = {
-            'answer': answer,
-            'max_attempts': max_attempts,
-            'remaining': max_attempts,
-            'start_time': datetime.now(),
-            'guesses': [],
-            'hints_used': set()
-        }
+        logger.info(f"会话 {group_id} 开始新游戏")
+        self.cold_games.pop(group_id)
+        self.games[group_id] = GameState(answer['id'], answer['曲名'], max_attempts, origin=origin)
         self._save_game(group_id)
         return f"{info}游戏开始！请在{max_attempts}次尝试内猜出曲目！\nID＞曲名＞俗名，/mg tip：获取提示，/mg guess 曲名：猜测曲目\n" \
 
+    @_session_locked
     def stop_game(self, group_id):
-        game = self.games.pop(group_id, None)
-        self.games_db.remove(Query().group_id == group_id)
+        game = self._get_game(group_id)
+        self.games.pop(group_id, None)
+        self.game_store.delete(group_id)
         if not game:
             return "当前没有进行中的游戏"
-        text = f"游戏结束！正确答案是：{game['answer']['曲名']}"
-        art = self._get_artwork_path(game['answer']['id'])
+        text = f"游戏结束！正确答案是：{game.answer_title}"
+        art = self._get_artwork_path(game.answer_id)
         if art:
             return text, art
         return text
 
-    def _process_guess(self, song_name):
+    @metrics.timed('process_guess')
+    def _process_guess(self, song_name, fuzzy=True):
+        # 整个解析过程只读取一次目录引用，热更新时不会混用新旧两个版本；
+        # fuzzy 为假时（群内闲聊）不做相似度匹配，只接受子串命中，避免普通聊天误中答案；
+        # 除总耗时外按最终命中的阶段分别记录延迟，便于区分慢在缓存、精确匹配还是模糊匹配
+        start = time.perf_counter()
+        catalog = self.catalog
+        key = (song_name.casefold(), fuzzy)
+        hit, song_id = self.resolve_cache.get(catalog.version, key)
+        if hit:
+            metrics.incr('resolve', stage='cache')
+            guess = catalog.get(song_id) if song_id is not None else None
+            metrics.observe('process_guess_cache', time.perf_counter() - start)
+            return guess
+
         guess = None
-        if song_name.isdigit():
-            guess = self._get_song_by_id(int(song_name))
+        stage = 'miss'
+        if song_name.isascii() and song_name.isdigit():
+            guess = catalog.get(int(song_name))
+            stage = 'id'
         if not guess:
-            guess = self._exact_song_name(song_name)
+            guess = catalog.find_by_title(song_name)
+            stage = 'title'
         if not guess:
-            guess = self._find_song_by_alias(song_name)
+            guess = catalog.find_by_alias(song_name)
+            stage = 'alias'
         if not guess:
-            candidates = self._fuzzy_search(song_name)
+            candidates = catalog.fuzzy_search(song_name, substring_only=not fuzzy)
             guess = candidates[0] if candidates else None
+            stage = 'fuzzy' if guess else 'miss'
+        metrics.incr('resolve', stage=stage)
+        self.resolve_cache.put(catalog.version, key, guess['id'] if guess else None)
+        metrics.observe(f'process_guess_{stage}', time.perf_counter() - start)
         return guess
 
+    @_session_locked
     def handle_guess(self, group_id, user_name, song_name, consume_attempt=True):
-        if group_id not in self.games:
+        game = self._get_game(group_id)
+        if not game:
             return "当前没有进行中的游戏，请先输入/mg start 开始游戏"
-        game = self.games[group_id]
 
-        guess = self._process_guess(song_name)
+        guess = self._process_guess(song_name, fuzzy=consume_attempt)
         if not guess:
             return "未找到相关曲目，请重新尝试"
 
         if consume_attempt:
-            game['remaining'] -= 1
+            game.remaining -= 1
             self._save_game(group_id)
 
-        game['guesses'].append((user_name, guess))
+        game.add_guess(user_name, guess['id'])
 
-        if guess['id'] == game['answer']['id']:
-            self._record_winner_and_runner_up(group_id, user_name, game['guesses'])
+        if guess['id'] == game.answer_id:
+            # 先结束对局再记录胜者：共享模式下删除带版本检查，多个进程同时猜中时只有一个能记录
             self.games.pop(group_id)
-            self.games_db.remove(Query().group_id == group_id)
-            text = f"恭喜 {user_name} 猜对了！正确答案是：{game['answer']['曲名']}"
+            self.game_store.delete(group_id)
+            self._record_winner_and_runner_up(group_id, user_name, game.guesses)
+            text = f"恭喜 {user_name} 猜对了！正确答案是：{game.answer_title}"
             art = self._get_artwork_path(guess['id'])
             if art:
                 return text, art
             return text
 
-        if game['remaining'] == 0 and consume_attempt:
+        if game.remaining == 0 and consume_attempt:
             self.games.pop(group_id)
-            self.games_db.remove(Query().group_id == group_id)
-            text = f"游戏结束！你已用完所有尝试次数。正确答案是：{game['answer']['曲名']}"
-            art = self._get_artwork_path(game['answer']['id'])
+            self.game_store.delete(group_id)
+            text = f"游戏结束！你已用完所有尝试次数。正确答案是：{game.answer_title}"
+            art = self._get_artwork_path(game.answer_id)
             if art:
                 return text, art
             return text
 
         if consume_attempt:
-            output = [f"❌ 猜错了！剩余尝试次数：{game['remaining']}\n你的猜测：{guess['曲名']}"]
-            answer = game['answer']
-            key_items = []
-
-            fields_to_compare = [
-                '曲师', 'FTR谱师', '难度分级', '语言', '背景', '侧', '曲包'
-            ]
-            for field in fields_to_compare:
-                gv = guess.get(field)
-                av = answer.get(field)
-                if field in ['曲师', 'FTR谱师', '曲包']:
-                    if gv == av:
-                        key_items.append(f"✅{field}: {gv}")
-                    continue
-                if gv is None and av is None:
-                    output.append(f"✅{field}: N/A")
-                elif gv is None:
-                    output.append(f"🚫{field}: N/A")
-                elif av is None:
-                    output.append(f"🚫{field}: {gv}")
-                elif gv == av:
-                    output.append(f"✅{field}: {gv}")
-                else:
-                    output.append(f"❌{field}: {gv}")
-
-            def parse_d(d): return float(d.replace('+', '.5').replace('?', '0')) if d else None
-
-            for short, label in [('FTR难度','FTR难度'), ('BYD难度','BYD难度'), ('ETR难度','ETR难度')]:
-                gv = parse_d(guess.get(short))
-                av = parse_d(answer.get(short))
-                if gv is not None and av is not None:
-                    if gv < av:    output.append(f"⬆️{label}: {guess[short]}")
-                    elif gv > av:  output.append(f"⬇️{label}: {guess[short]}")
-                    else:          output.append(f"✅{label}: {guess[short]}")
-                elif gv is None and av is None:
-                    output.append(f"✅{label}: N/A")
-                else:
-                    output.append(f"🚫{label}: {guess.get(short, 'N/A')}")
-
-            # 版本
-            gv = parse_d(guess.get('版本'))
-            av = parse_d(answer.get('版本'))
-            if gv is not None and av is not None:
-                if gv < av:    output.append(f"⬆️版本: {guess['版本']}")
-                elif gv > av:  output.append(f"⬇️版本: {guess['版本']}")
-                else:          output.append(f"✅版本: {guess['版本']}")
-            elif gv is None and av is None:
-                output.append(f"✅版本: N/A")
-            else:
-                output.append(f"🚫版本: {guess.get('版本', 'N/A')}")
-
-            if key_items:
-                output.append("\n你发现了关键项！")
-                output.extend(key_items)
+            output = [f"❌ 猜错了！剩余尝试次数：{game.remaining}\n你的猜测：{guess['曲名']}"]
+            output.extend(render_feedback(self.catalog.vector(guess['id'], guess), self._answer_vector(game)))
 
             return "\n".join(output)
         return None
@@ -239,40 +424,246 @@ class GameManager:
         return self.handle_guess(group_id, user_name, song_name, consume_attempt=False)
 
     def _record_winner_and_runner_up(self, group_id, winner_name, guesses):
-        self.winners_db.insert({'group': group_id, 'winner': winner_name, 'time': datetime.now().isoformat()})
+        self.winners.record(group_id, winner_name)
 
     def get_leaderboard(self, group_id, top_n):
-        winners = self.winners_db.search((Query().group == group_id) & Query().winner.exists())
-        count = {}
-        for e in winners:
-            count[e['winner']] = count.get(e['winner'], 0) + 1
-        top = sorted(count.items(), key=lambda x: x[1], reverse=True)[:top_n]
+        top = self.winners.top(group_id, top_n)
         return "冠军榜:\n" + "\n".join(f"{n}: {c}" for n, c in top)
 
+    def get_stats(self):
+        cache = self.resolve_cache.stats()
+        lines = [
+            f"进行中对局：内存 {len(self.games)}，冷存储 {len(self.cold_games)}"
+            + (f"，共享存储 {len(self.game_store)}" if self.shared else ""),
+            f"曲目数：{len(self.catalog)}",
+            f"解析缓存：{cache['size']} 条，命中率 {cache['hit_rate']:.1%}"
+            f"（命中 {cache['hits']}，未命中 {cache['misses']}）",
+            metrics.render(),
+        ]
+        return "\n".join(line for line in lines if line)
+
+    @metrics.timed('get_hint')
+    @_session_locked
     def get_hint(self, group_id):
-        game = self.games.get(group_id)
+        game = self._get_game(group_id)
         if not game:
             return "当前没有进行中的游戏"
-        base = game['answer']['曲名']
-        hint_dir = "/AstrBot/data/image/"
-        pattern = re.compile(rf"^{re.escape(base)}-(a|b)-\d+\.png$")
-        files = [f for f in os.listdir(hint_dir) if pattern.match(f)]
-        avail = [f for f in files if f not in game['hints_used']]
+        files = self.hints.get(game.answer_title)
+        avail = [f for f in files if f not in game.hints_used]
         if not avail:
             return "提示已用尽"
         choice = random.choice(avail)
-        game['hints_used'].add(choice)
+        game.hints_used.add(choice)
+        game.touch()
         self._save_game(group_id)
-        remain = len(files) - len(game['hints_used'])
-        return os.path.join(hint_dir, choice), f"提示还剩 {remain} 条"
+        remain = len(files) - len(game.hints_used)
+        return os.path.join(self.hint_dir, choice), f"提示还剩 {remain} 条"
+
+class AsyncGameManager:
+    """
+    GameManager 的异步外观。
+
+    会阻塞的操作（存储读写、文件检查、提示目录扫描）放到有界线程池中执行，
+    纯内存的检查直接调用，事件循环不再被磁盘 I/O 卡住。
+    群设置修改与排行榜在 SQLite 后端下会访问数据库，因此也在线程池中执行。
+    """
+
+    def __init__(self, manager, executor):
+        self.manager = manager
+        self._executor = executor
+
+    @classmethod
+    async def create(cls, db_path, data_dir='/AstrBot/data', backend='tinydb', shared=False,
+                     max_workers=IO_WORKERS):
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='mg-guessr')
+        loop = asyncio.get_running_loop()
+        manager = await loop.run_in_executor(executor, GameManager, db_path, data_dir, backend, shared)
+        return cls(manager, executor)
+
+    async def _run(self, fn, *args, **kwargs):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+
+    def has_game(self, group_id):
+        return self.manager.has_game(group_id)
+
+    @property
+    def catalog(self):
+        return self.manager.catalog
+
+    @property
+    def shared(self):
+        return self.manager.shared
+
+    def is_group_enabled(self, group_id):
+        return self.manager.is_group_enabled(group_id)
+
+    async def enable_group(self, group_id):
+        await self._run(self.manager.enable_group, group_id)
+
+    async def disable_group(self, group_id):
+        await self._run(self.manager.disable_group, group_id)
+
+    async def get_leaderboard(self, group_id, top_n):
+        return await self._run(self.manager.get_leaderboard, group_id, top_n)
+
+    def get_stats(self):
+        return self.manager.get_stats()
+
+    async def start_game(self, group_id, max_attempts=5, origin=None):
+        return await self._run(self.manager.start_game, group_id, max_attempts, origin)
+
+    async def stop_game(self, group_id):
+        return await self._run(self.manager.stop_game, group_id)
+
+    async def handle_guess(self, group_id, user_name, song_name):
+        return await self._run(self.manager.handle_guess, group_id, user_name, song_name)
+
+    async def handle_non_command_guess(self, group_id, user_name, song_name):
+        return await self._run(self.manager.handle_non_command_guess, group_id, user_name, song_name)
+
+    async def get_hint(self, group_id):
+        return await self._run(self.manager.get_hint, group_id)
+
+    async def poll_shared(self):
+        await self._run(self.manager.poll_shared)
+
+    async def sweep(self, idle_ttl, cold_after):
+        return await self._run(self.manager.sweep, idle_ttl, cold_after)
+
+    async def catalog_outdated(self):
+        return await self._run(self.manager.catalog_outdated)
+
+    async def reload_catalog(self):
+        await self._run(self.manager.reload_catalog)
+
+    async def flush(self):
+        await self._run(self.manager.flush)
+
+    async def close(self):
+        await self._run(self.manager.close)
+        self._executor.shutdown(wait=True)
 
 @register("mg-guessr", "star0", "mg-guessr", "1.0.0")
 class MyPlugin(Star):
-    def init(self, context: Context):
-        super().init(context)
+    def __init__(self, context: Context, config: AstrBotConfig = None):
+        super().__init__(context)
+        self.config = config or {}
+        # 会话 id -> 消息来源；新对局的来源随对局记录保存，这里只为旧版本保存、没有来源的对局兜底
+        self._origins = {}
+        self._throttle = ChatThrottle(
+            rate=self.config.get('chat_rate_per_second', 3),
+            burst=self.config.get('chat_burst', 10),
+            window=self.config.get('chat_coalesce_seconds', 1),
+        )
+        # 同一会话的猜测按到达顺序依次交给 GameManager（asyncio.Lock 先到先得），
+        # 保证最先发出的正确答案获胜，也避免一个群同时占用多个工作线程
+        self._guess_locks = {}
+
+    def _guess_lock(self, session_id):
+        lock = self._guess_locks.get(session_id)
+        if lock is None:
+            lock = self._guess_locks[session_id] = asyncio.Lock()
+        return lock
+
+    def _prune_sessions(self):
+        self._throttle.prune(THROTTLE_IDLE)
+        self._guess_locks = {
+            session_id: lock for session_id, lock in self._guess_locks.items()
+            if lock.locked() or self.game_manager.has_game(session_id)
+        }
+        # 猜中、/mg stop 或次数用尽结束的对局不会经过超时公布，在这里一并清理消息来源
+        self._origins = {
+            session_id: origin for session_id, origin in self._origins.items()
+            if self.game_manager.has_game(session_id)
+        }
 
     async def initialize(self):
-        self.game_manager = GameManager('/AstrBot/data/songs_db.json')
+        self.game_manager = await AsyncGameManager.create(
+            '/AstrBot/data/songs_db.json',
+            backend=self.config.get('storage_backend', 'tinydb'),
+            shared=self.config.get('shared_state', False),
+        )
+        self._flush_task = asyncio.create_task(self._flush_loop())
+        self._refresh_task = asyncio.create_task(self._refresh_loop())
+        self._sweep_task = asyncio.create_task(self._sweep_loop())
+        self._poll_task = None
+        if self.game_manager.shared:
+            self._poll_task = asyncio.create_task(self._poll_loop())
+
+    async def _poll_loop(self):
+        # 共享模式：在线程池中检查其他进程的修改，事件循环上的 has_game / is_group_enabled 只读快照
+        while True:
+            await asyncio.sleep(SHARED_POLL_INTERVAL)
+            try:
+                await self.game_manager.poll_shared()
+            except Exception as e:
+                logger.error(f"同步共享状态失败: {e}")
+
+    async def _refresh_loop(self):
+        # 启动时立即检查一次曲目数据，之后按配置的间隔定期刷新；间隔不大于 0 时只在加载时检查一次
+        interval = self.config.get('catalog_refresh_hours', 24) * 3600
+        while True:
+            try:
+                changed = await initialize_data()
+                if changed or await self.game_manager.catalog_outdated():
+                    await self.game_manager.reload_catalog()
+            except Exception as e:
+                logger.error(f"曲目数据刷新失败: {e}")
+            if interval <= 0:
+                return
+            await asyncio.sleep(interval)
+
+    async def _sweep_loop(self):
+        idle_ttl = self.config.get('idle_ttl_minutes', 120) * 60
+        cold_after = self.config.get('cold_after_minutes', 10) * 60
+        while True:
+            await asyncio.sleep(SWEEP_INTERVAL)
+            try:
+                expired = await self.game_manager.sweep(idle_ttl, cold_after)
+            except Exception as e:
+                logger.error(f"清理闲置对局失败: {e}")
+                continue
+            for session_id, res, origin in expired:
+                # 对局记录中的来源优先：共享模式下结束这局的可能是从未见过该会话的进程
+                fallback = self._origins.pop(session_id, None)
+                origin = origin or fallback
+                if not origin or not self.config.get('announce_expired', True):
+                    continue
+                chain = MessageChain()
+                if isinstance(res, tuple):
+                    text, img = res
+                    chain.message(text).file_image(img)
+                else:
+                    chain.message(res)
+                try:
+                    await self.context.send_message(origin, chain)
+                except Exception as e:
+                    logger.error(f"公布超时对局答案失败: {e}")
+            self._prune_sessions()
+
+    async def _flush_loop(self):
+        while True:
+            await asyncio.sleep(FLUSH_INTERVAL)
+            try:
+                await self.game_manager.flush()
+            except Exception as e:
+                logger.error(f"对局数据写入失败: {e}")
+            metrics_file = self.config.get('metrics_file')
+            if metrics_file:
+                try:
+                    await asyncio.to_thread(metrics.dump, metrics_file)
+                except OSError as e:
+                    logger.error(f"导出统计数据失败: {e}")
+
+    async def terminate(self):
+        self._flush_task.cancel()
+        self._refresh_task.cancel()
+        self._sweep_task.cancel()
+        if self._poll_task:
+            self._poll_task.cancel()
+        await close_client()
+        await self.game_manager.close()
 
     @filter.command_group("mg", alias={'猜歌'})
     async def mg(self, event: AstrMessageEvent):
@@ -290,10 +681,12 @@ class MyPlugin(Star):
                 yield event.plain_result("该群未启用猜曲功能，请管理员使用/mg enable启用")
                 return
         
-        res = self.game_manager.start_game(session_id, max_n)
+        res = await self.game_manager.start_game(session_id, max_n, event.unified_msg_origin)
+        self._origins[session_id] = event.unified_msg_origin
+        self._throttle.reset(session_id)
         yield event.plain_result(res)
         
-        res = self.game_manager.get_hint(session_id)
+        res = await self.game_manager.get_hint(session_id)
         if isinstance(res, tuple):
             path, info = res
             chain = [Comp.Plain(info), Comp.Image.fromFileSystem(path)]
@@ -305,7 +698,7 @@ class MyPlugin(Star):
     @mg.command("stop", alias={'结束'})
     async def stop(self, event: AstrMessageEvent):
         session_id = event.get_session_id()
-        res = self.game_manager.stop_game(session_id)
+        res = await self.game_manager.stop_game(session_id)
         if isinstance(res, tuple):
             text, img = res
             chain = [Comp.Plain(text), Comp.Image.fromFileSystem(img)]
@@ -320,7 +713,8 @@ class MyPlugin(Star):
             yield event.plain_result("该群未启用猜曲功能")
             return
         
-        res = self.game_manager.handle_guess(session_id, event.get_sender_name(), title)
+        async with self._guess_lock(session_id):
+            res = await self.game_manager.handle_guess(session_id, event.get_sender_name(), title)
         if isinstance(res, tuple):
             text, img = res
             chain = [Comp.Plain(text), Comp.Image.fromFileSystem(img)]
@@ -331,7 +725,7 @@ class MyPlugin(Star):
     @mg.command("rank", alias={'排行榜'})
     async def rank(self, event: AstrMessageEvent, top_n: int = 10):
         session_id = event.get_session_id()
-        yield event.plain_result(self.game_manager.get_leaderboard(session_id, top_n))
+        yield event.plain_result(await self.game_manager.get_leaderboard(session_id, top_n))
 
     @mg.command("tip", alias={'提示'})
     async def tip(self, event: AstrMessageEvent):
@@ -340,7 +734,7 @@ class MyPlugin(Star):
             yield event.plain_result("该群未启用猜曲功能")
             return
         
-        res = self.game_manager.get_hint(session_id)
+        res = await self.game_manager.get_hint(session_id)
         if isinstance(res, tuple):
             path, info = res
             chain = [Comp.Plain(info), Comp.Image.fromFileSystem(path)]
@@ -351,15 +745,29 @@ class MyPlugin(Star):
     @filter.event_message_type(filter.EventMessageType.ALL)
     async def handle_all_messages(self, event: AstrMessageEvent):
         session_id = event.get_session_id()
-        if not self.game_manager or not self.game_manager.games:
+        if not self.game_manager or not self.game_manager.has_game(session_id):
+            return
+        self._origins.setdefault(session_id, event.unified_msg_origin)
+        start = time.perf_counter()
+        message_str = event.message_str.strip()
+        # 预筛：明显不是曲名的闲聊直接跳过，不进入完整的解析流程
+        if not self.game_manager.catalog.is_plausible(message_str):
+            metrics.incr('chat_message', result='filtered')
+            metrics.observe('handle_all_messages', time.perf_counter() - start)
             return
 
-        if session_id not in self.game_manager.games:
+        # 限流与合并：超出速率或窗口内重复的猜测不再解析
+        dropped = self._throttle.check(session_id, message_str)
+        if dropped:
+            metrics.incr('chat_message', result=dropped)
+            metrics.observe('handle_all_messages', time.perf_counter() - start)
             return
-        message_str = event.message_str.strip()
 
         # 调用猜测逻辑，但不消耗次数
-        res = self.game_manager.handle_non_command_guess(session_id, event.get_sender_name(), message_str)
+        async with self._guess_lock(session_id):
+            res = await self.game_manager.handle_non_command_guess(session_id, event.get_sender_name(), message_str)
+        metrics.incr('chat_message', result='resolved')
+        metrics.observe('handle_all_messages', time.perf_counter() - start)
         
         # 如果猜对，返回结果；如果没猜中，res 为 None，自动静默
         if not(res) or res[0].startswith("恭喜"):
@@ -393,7 +801,7 @@ class MyPlugin(Star):
                 if ret['role'] not in ['owner', 'admin']:
                     yield event.plain_result("权限不足，需要群主或管理员")
                     return
-                self.game_manager.enable_group(group_id)
+                await self.game_manager.enable_group(group_id)
                 yield event.plain_result("已启用该群的猜曲功能")
             except Exception as e:
                 yield event.plain_result(f"操作失败: {e}")
@@ -422,13 +830,18 @@ class MyPlugin(Star):
                 if ret['role'] not in ['owner', 'admin']:
                     yield event.plain_result("权限不足，需要群主或管理员")
                     return
-                self.game_manager.disable_group(group_id)
+                await self.game_manager.disable_group(group_id)
                 yield event.plain_result("已禁用该群的猜曲功能")
             except Exception as e:
                 yield event.plain_result(f"操作失败: {e}")
         else:
             yield event.plain_result("该平台暂不支持此命令")
 
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @mg.command("stats", alias={'统计'})
+    async def stats(self, event: AstrMessageEvent):
+        yield event.plain_result(self.game_manager.get_stats())
+
     @mg.command("help", alias={'帮助'})
     async def help_text(self, event: AstrMessageEvent):
         help_msg = (
@@ -439,6 +852,7 @@ class MyPlugin(Star):
             "/mg rank [n] 查看排行榜\n"
             "/mg enable 启用本群功能（管理员）\n"
             "/mg disable 禁用本群功能（管理员）\n"
+            "/mg stats 查看运行统计（Bot 管理员）\n"
             "/mg help 获取帮助信息\n"
             "感谢rosemoe提供俗名库\n"
             "Version: 1.4.0 新增持久化、支持私聊、全局开关和[?未知特性]"
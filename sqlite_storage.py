@@ -0,0 +1,472 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from tinydb import TinyDB
+from astrbot.api import logger
+from data.plugins.astrbot_plugin_mg_guessr.storage import (
+    Storage, GameStore, ColdGameStore, GroupSettings, ConflictError
+)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT
+);
+CREATE TABLE IF NOT EXISTS games (
+    group_id TEXT PRIMARY KEY,
+    record TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    last_active REAL NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS cold_games (
+    group_id TEXT PRIMARY KEY,
+    record TEXT NOT NULL,
+    last_active REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_cold_games_last_active ON cold_games (last_active);
+CREATE TABLE IF NOT EXISTS winners (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    group_id TEXT NOT NULL,
+    winner TEXT NOT NULL,
+    time TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_winners_group ON winners (group_id);
+CREATE TABLE IF NOT EXISTS win_counts (
+    group_id TEXT NOT NULL,
+    winner TEXT NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (group_id, winner)
+);
+CREATE INDEX IF NOT EXISTS idx_win_counts_rank ON win_counts (group_id, count DESC);
+CREATE TABLE IF NOT EXISTS group_settings (
+    group_id INTEGER PRIMARY KEY,
+    enabled INTEGER NOT NULL
+);
+"""
+
+
+class SQLiteDB:
+    """共享的 SQLite 连接（WAL 模式），各存储对象通过同一把锁串行访问"""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute('PRAGMA busy_timeout=5000')
+        self.conn.executescript(SCHEMA)
+        self._upgrade()
+
+    def _upgrade(self):
+        # 早期版本的 games 表没有版本号与最后活跃时间
+        columns = {row[1] for row in self.conn.execute('PRAGMA table_info(games)')}
+        if 'version' not in columns:
+            self.conn.execute('ALTER TABLE games ADD COLUMN version INTEGER NOT NULL DEFAULT 0')
+        if 'last_active' not in columns:
+            self.conn.execute('ALTER TABLE games ADD COLUMN last_active REAL NOT NULL DEFAULT 0')
+        self.conn.execute('CREATE INDEX IF NOT EXISTS idx_games_last_active ON games (last_active)')
+
+    def data_version(self):
+        # 其他连接（包括其他进程）提交后该值会变化，本连接自己的提交不会改变它
+        with self.lock:
+            return self.conn.execute('PRAGMA data_version').fetchone()[0]
+
+    def get_meta(self, key):
+        with self.lock:
+            row = self.conn.execute('SELECT value FROM meta WHERE key = ?', (key,)).fetchone()
+        return row[0] if row else None
+
+    def set_meta(self, key, value='1'):
+        with self.lock:
+            self.conn.execute('INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)', (key, value))
+
+    def transaction(self):
+        return _Transaction(self)
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class _Transaction:
+    def __init__(self, db):
+        self.db = db
+
+    def __enter__(self):
+        self.db.lock.acquire()
+        try:
+            self.db.conn.execute('BEGIN IMMEDIATE')
+        except BaseException:
+            # BEGIN 失败（如等待其他进程超时）时 __exit__ 不会执行，必须在这里释放锁
+            self.db.lock.release()
+            raise
+        return self.db.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            self.db.conn.execute('ROLLBACK' if exc_type else 'COMMIT')
+        finally:
+            self.db.lock.release()
+
+
+class SQLiteGameStore:
+    """进行中对局：写入按群合并，flush 时在一个事务内逐行 upsert / delete"""
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._pending = {}
+
+    def exists(self):
+        return self.db.get_meta('games') is not None
+
+    def all(self):
+        with self.db.lock:
+            rows = self.db.conn.execute('SELECT group_id, record FROM games').fetchall()
+        records = {group_id: json.loads(record) for group_id, record in rows}
+        with self._lock:
+            for group_id, pending in self._pending.items():
+                if pending is None:
+                    records.pop(group_id, None)
+                else:
+                    records[group_id] = pending[0]
+        return records
+
+    def put(self, group_id, record, last_active=None):
+        with self._lock:
+            self._pending[group_id] = (record, last_active or time.time())
+
+    def delete(self, group_id):
+        with self._lock:
+            self._pending[group_id] = None
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+        upserts = [(g, json.dumps(p[0], ensure_ascii=False), p[1]) for g, p in batch.items() if p is not None]
+        deletes = [(g,) for g, p in batch.items() if p is None]
+        with self.db.transaction() as conn:
+            conn.executemany('INSERT OR REPLACE INTO games (group_id, record, last_active) VALUES (?, ?, ?)',
+                             upserts)
+            conn.executemany('DELETE FROM games WHERE group_id = ?', deletes)
+
+    def close(self):
+        self.flush()
+        self.db.set_meta('games')
+
+
+class SharedGameStore:
+    """
+    多进程共享模式下的进行中对局：每次修改立即写入，并以每局的版本号做比较并交换，
+    版本号与预期不一致时抛出 ConflictError。
+
+    本进程记录每局最后读到或写入的版本号；PRAGMA data_version 变化说明其他进程提交过，
+    此时重新读取各局的版本号，据此判断本地副本是否过期。版本号取自全局递增的计数，
+    对局结束后重新创建也不会与旧版本号重复。
+    """
+
+    def __init__(self, db):
+        self.db = db
+        self._seen = {}
+        self._remote = {}
+        self._data_version = None
+
+    def _refresh(self):
+        # 调用方需持有 db.lock
+        data_version = self.db.conn.execute('PRAGMA data_version').fetchone()[0]
+        if data_version != self._data_version:
+            self._data_version = data_version
+            self._remote = dict(self.db.conn.execute('SELECT group_id, version FROM games'))
+
+    def exists(self):
+        return self.db.get_meta('games') is not None
+
+    def refresh(self):
+        """检查其他进程的提交并更新版本号快照；会访问数据库，应在线程池中调用"""
+        with self.db.lock:
+            self._refresh()
+
+    # 以下两项只读取内存中的快照，事件循环可直接调用；快照由 refresh 与本进程的读写更新
+    def __contains__(self, group_id):
+        return group_id in self._remote
+
+    def __len__(self):
+        return len(self._remote)
+
+    def is_stale(self, group_id):
+        """本地副本的版本号是否已落后于共享存储（包括已被其他进程结束）"""
+        with self.db.lock:
+            self._refresh()
+            return self._remote.get(group_id) != self._seen.get(group_id)
+
+    def get(self, group_id):
+        with self.db.lock:
+            row = self.db.conn.execute(
+                'SELECT record, version FROM games WHERE group_id = ?', (group_id,)
+            ).fetchone()
+            if row is None:
+                self._seen.pop(group_id, None)
+                self._remote.pop(group_id, None)
+                return None
+            self._seen[group_id] = self._remote[group_id] = row[1]
+        return json.loads(row[0])
+
+    def all(self):
+        with self.db.lock:
+            rows = self.db.conn.execute('SELECT group_id, record, version FROM games').fetchall()
+            for group_id, _, version in rows:
+                self._seen[group_id] = self._remote[group_id] = version
+        return {group_id: json.loads(record) for group_id, record, _ in rows}
+
+    def _next_version(self, conn):
+        conn.execute(
+            "INSERT INTO meta (key, value) VALUES ('game_version', 1) "
+            "ON CONFLICT (key) DO UPDATE SET value = CAST(value AS INTEGER) + 1"
+        )
+        return int(conn.execute("SELECT value FROM meta WHERE key = 'game_version'").fetchone()[0])
+
+    def put(self, group_id, record, last_active=None):
+        expected = self._seen.get(group_id)
+        data = json.dumps(record, ensure_ascii=False)
+        with self.db.transaction() as conn:
+            version = self._next_version(conn)
+            if expected is None:
+                cursor = conn.execute(
+                    'INSERT INTO games (group_id, record, version, last_active) VALUES (?, ?, ?, ?) '
+                    'ON CONFLICT (group_id) DO NOTHING',
+                    (group_id, data, version, last_active or time.time())
+                )
+            else:
+                cursor = conn.execute(
+                    'UPDATE games SET record = ?, version = ?, last_active = ? WHERE group_id = ? AND version = ?',
+                    (data, version, last_active or time.time(), group_id, expected)
+                )
+            if cursor.rowcount != 1:
+                raise ConflictError(group_id)
+            self._seen[group_id] = self._remote[group_id] = version
+
+    def delete(self, group_id):
+        expected = self._seen.pop(group_id, None)
+        with self.db.transaction() as conn:
+            if expected is None:
+                # 本进程没有读到过这局：只有共享存储中确实没有时才算成功
+                if conn.execute('SELECT 1 FROM games WHERE group_id = ?', (group_id,)).fetchone():
+                    raise ConflictError(group_id)
+            elif conn.execute('DELETE FROM games WHERE group_id = ? AND version = ?',
+                              (group_id, expected)).rowcount != 1:
+                raise ConflictError(group_id)
+            self._remote.pop(group_id, None)
+
+    def idle_ids(self, idle_seconds):
+        with self.db.lock:
+            rows = self.db.conn.execute(
+                'SELECT group_id FROM games WHERE last_active < ?', (time.time() - idle_seconds,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+    def flush(self):
+        pass
+
+    def close(self):
+        self.db.set_meta('games')
+
+
+class SQLiteColdGameStore:
+    """冷对局：内存中只保留会话 id 集合，记录与最后活跃时间存于 cold_games 表"""
+
+    def __init__(self, db):
+        self.db = db
+        with db.lock:
+            self._ids = {row[0] for row in db.conn.execute('SELECT group_id FROM cold_games')}
+
+    def __contains__(self, group_id):
+        return group_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def put(self, group_id, record, last_active=None):
+        with self.db.lock:
+            self.db.conn.execute(
+                'INSERT OR REPLACE INTO cold_games (group_id, record, last_active) VALUES (?, ?, ?)',
+                (group_id, json.dumps(record, ensure_ascii=False), last_active or time.time())
+            )
+            self._ids.add(group_id)
+
+    def pop(self, group_id):
+        with self.db.transaction() as conn:
+            if group_id not in self._ids:
+                return None
+            self._ids.discard(group_id)
+            row = conn.execute('SELECT record FROM cold_games WHERE group_id = ?', (group_id,)).fetchone()
+            conn.execute('DELETE FROM cold_games WHERE group_id = ?', (group_id,))
+        return json.loads(row[0]) if row else None
+
+    def idle_ids(self, idle_seconds):
+        with self.db.lock:
+            rows = self.db.conn.execute(
+                'SELECT group_id FROM cold_games WHERE last_active < ?', (time.time() - idle_seconds,)
+            ).fetchall()
+        return [row[0] for row in rows]
+
+
+class SQLiteWinnerBoard:
+    """胜场记录：原始记录与按群计数在同一事务中写入，排行榜走 (group_id, count) 索引"""
+
+    def __init__(self, db):
+        self.db = db
+
+    def import_log(self, entries):
+        with self.db.transaction() as conn:
+            conn.executemany(
+                'INSERT INTO winners (group_id, winner, time) VALUES (?, ?, ?)',
+                [(e['group'], e['winner'], e.get('time', '')) for e in entries if 'winner' in e]
+            )
+        self.rebuild()
+
+    def rebuild(self):
+        with self.db.transaction() as conn:
+            conn.execute('DELETE FROM win_counts')
+            conn.execute(
+                'INSERT INTO win_counts (group_id, winner, count) '
+                'SELECT group_id, winner, COUNT(*) FROM winners GROUP BY group_id, winner ORDER BY MIN(id)'
+            )
+
+    def record(self, group_id, winner_name):
+        with self.db.transaction() as conn:
+            conn.execute('INSERT INTO winners (group_id, winner, time) VALUES (?, ?, ?)',
+                         (group_id, winner_name, datetime.now().isoformat()))
+            conn.execute(
+                'INSERT INTO win_counts (group_id, winner, count) VALUES (?, ?, 1) '
+                'ON CONFLICT (group_id, winner) DO UPDATE SET count = count + 1',
+                (group_id, winner_name)
+            )
+
+    def top(self, group_id, top_n):
+        # 同分时按首次获胜的先后排序，与旧版行为一致
+        with self.db.lock:
+            return self.db.conn.execute(
+                'SELECT winner, count FROM win_counts WHERE group_id = ? ORDER BY count DESC, rowid LIMIT ?',
+                (group_id, top_n)
+            ).fetchall()
+
+
+class SQLiteGroupSettings:
+    """群启用状态：内存集合供权限检查使用，flush 时只写入有变化的行"""
+
+    def __init__(self, db):
+        self.db = db
+        self._lock = threading.Lock()
+        self._dirty = {}
+        self._load()
+
+    def _load(self):
+        with self.db.lock:
+            self._enabled = {row[0] for row in self.db.conn.execute(
+                'SELECT group_id FROM group_settings WHERE enabled = 1')}
+
+    def exists(self):
+        return self.db.get_meta('group_settings') is not None
+
+    def is_enabled(self, group_id):
+        return int(group_id) in self._enabled
+
+    def set_enabled(self, group_id, enabled):
+        with self._lock:
+            if enabled:
+                self._enabled.add(int(group_id))
+            else:
+                self._enabled.discard(int(group_id))
+            self._dirty[int(group_id)] = bool(enabled)
+
+    def flush(self, force=False):
+        with self._lock:
+            batch, self._dirty = self._dirty, {}
+        if batch:
+            with self.db.transaction() as conn:
+                conn.executemany('INSERT OR REPLACE INTO group_settings (group_id, enabled) VALUES (?, ?)',
+                                 [(g, int(e)) for g, e in batch.items()])
+        if force:
+            self.db.set_meta('group_settings')
+
+
+class SharedGroupSettings(SQLiteGroupSettings):
+    """
+    共享模式下的群设置：修改立即写入；其他进程的修改由 refresh 在 data_version 变化时重新读取。
+
+    is_enabled 只读取内存集合，refresh 与 set_enabled 会访问数据库，应在线程池中调用。
+    """
+
+    def __init__(self, db):
+        self._data_version = db.data_version()
+        super().__init__(db)
+
+    def refresh(self):
+        data_version = self.db.data_version()
+        if data_version != self._data_version:
+            self._data_version = data_version
+            self._load()
+
+    def set_enabled(self, group_id, enabled):
+        super().set_enabled(group_id, enabled)
+        self.flush()
+
+
+class SQLiteStorage(Storage):
+    def __init__(self, path, shared=False):
+        self.db = SQLiteDB(path)
+        super().__init__(
+            SharedGameStore(self.db) if shared else SQLiteGameStore(self.db),
+            SQLiteColdGameStore(self.db),
+            SQLiteWinnerBoard(self.db),
+            SharedGroupSettings(self.db) if shared else SQLiteGroupSettings(self.db),
+        )
+
+    def close(self):
+        super().close()
+        self.db.close()
+
+
+def migrate_from_tinydb(data_dir, storage):
+    """
+    一次性把 TinyDB / JSON 文件中的对局、冷对局、胜场记录和群设置导入 SQLite。
+
+    原文件保留不动作为备份；迁移完成后在 meta 表中记录，不会重复执行。
+    """
+    if storage.db.get_meta('tinydb_migrated') is not None:
+        return
+
+    games_path = os.path.join(data_dir, 'games.json')
+    json_games = GameStore(games_path)
+    if json_games.exists():
+        for group_id, record in json_games.all().items():
+            storage.games.put(group_id, record)
+        storage.games.close()
+
+    cold_path = os.path.join(data_dir, 'games_cold')
+    if os.path.isdir(cold_path):
+        for group_id, record, last_active in ColdGameStore(cold_path).items():
+            storage.cold_games.put(group_id, record, last_active)
+
+    winners_path = os.path.join(data_dir, 'winners.json')
+    if os.path.exists(winners_path):
+        winners_db = TinyDB(winners_path)
+        try:
+            storage.winners.import_log(winners_db.all())
+        finally:
+            winners_db.close()
+
+    settings = GroupSettings(os.path.join(data_dir, 'group_settings.json'))
+    if settings.exists():
+        for group_id in settings.enabled_ids():
+            storage.group_settings.set_enabled(group_id, True)
+        storage.group_settings.flush(force=True)
+
+    storage.db.set_meta('tinydb_migrated')
+    logger.info("已将 TinyDB 中的对局、胜场记录与群设置迁移到 SQLite")
@@ -0,0 +1,74 @@
+import sys
+import time
+from collections import deque
+from datetime import datetime
+
+# 每局保留的猜测记录条数
+GUESS_HISTORY = 32
+
+
+class GameState:
+    """
+    单局游戏状态，只保存曲目 id 与驻留后的用户名。
+
+    猜测记录使用定长队列，序列化为紧凑的列表：
+    [答案 id, 答案曲名, 最大次数, 剩余次数, 开始时间戳, [[用户, 曲目 id], ...], [已用提示, ...], 最后活跃时间戳,
+     消息来源]
+
+    消息来源（unified_msg_origin）随对局保存，共享模式下任何进程结束超时对局时都能公布答案。
+    """
+
+    __slots__ = ('answer_id', 'answer_title', 'max_attempts', 'remaining',
+                 'start_time', 'guesses', 'hints_used', 'last_active', 'origin')
+
+    def __init__(self, answer_id, answer_title, max_attempts, remaining=None,
+                 start_time=None, guesses=(), hints_used=(), last_active=None, origin=None):
+        self.answer_id = answer_id
+        self.answer_title = answer_title
+        self.max_attempts = max_attempts
+        self.remaining = max_attempts if remaining is None else remaining
+        self.start_time = time.time() if start_time is None else start_time
+        self.guesses = deque(maxlen=GUESS_HISTORY)
+        for user_name, song_id in guesses:
+            self.add_guess(user_name, song_id)
+        self.hints_used = set(hints_used)
+        self.last_active = self.start_time if last_active is None else last_active
+        self.origin = origin
+
+    def touch(self):
+        self.last_active = time.time()
+
+    def add_guess(self, user_name, song_id):
+        self.guesses.append((sys.intern(user_name), song_id))
+        self.touch()
+
+    def to_record(self):
+        return [
+            self.answer_id,
+            self.answer_title,
+            self.max_attempts,
+            self.remaining,
+            self.start_time,
+            [list(g) for g in self.guesses],
+            sorted(self.hints_used),
+            self.last_active,
+            self.origin,
+        ]
+
+    @classmethod
+    def from_record(cls, record, catalog):
+        """从存储记录恢复；兼容旧版以字典保存、猜测中带完整曲目信息的格式"""
+        if isinstance(record, list):
+            return cls(*record)
+        answer = catalog.get(record['answer']['id'])
+        if not answer:
+            return None
+        return cls(
+            answer['id'],
+            answer['曲名'],
+            record['max_attempts'],
+            record['remaining'],
+            datetime.fromisoformat(record['start_time']).timestamp(),
+            [(user_name, song['id']) for user_name, song in record['guesses']],
+            record['hints_used'],
+        )
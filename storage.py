@@ -0,0 +1,386 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from urllib.parse import quote, unquote
+from datetime import datetime
+from tinydb import TinyDB, Query
+from astrbot.api import logger
+
+try:
+    import fcntl
+except ImportError:  # Windows 下没有 fcntl，退化为不加锁
+    fcntl = None
+
+
+class ConflictError(Exception):
+    """共享模式下写入对局时版本号不一致：这局已被其他进程修改"""
+
+
+@contextmanager
+def file_lock(path):
+    """跨进程的独占文件锁，多个 AstrBot 进程共用同一数据目录时用于串行化写入"""
+    if fcntl is None:
+        yield
+        return
+    with open(path, 'a') as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class Storage:
+    """
+    存储后端：进行中对局、冷对局、胜场记录与群设置。
+
+    各后端提供接口相同的四个存储对象，GameManager 只通过这些接口读写。
+    """
+
+    def __init__(self, games, cold_games, winners, group_settings):
+        self.games = games
+        self.cold_games = cold_games
+        self.winners = winners
+        self.group_settings = group_settings
+
+    def flush(self):
+        self.games.flush()
+        self.group_settings.flush()
+
+    def close(self):
+        self.games.close()
+        self.group_settings.flush()
+
+
+class TinyDBStorage(Storage):
+    """基于 JSON / TinyDB 文件的默认后端"""
+
+    def __init__(self, data_dir):
+        super().__init__(
+            GameStore(os.path.join(data_dir, 'games.json')),
+            ColdGameStore(os.path.join(data_dir, 'games_cold')),
+            WinnerBoard(os.path.join(data_dir, 'winners.json')),
+            GroupSettings(os.path.join(data_dir, 'group_settings.json')),
+        )
+
+
+def open_storage(data_dir, backend='tinydb', shared=False):
+    if shared and backend != 'sqlite':
+        logger.warning("多进程共享模式需要 SQLite 存储后端，已改用 sqlite")
+        backend = 'sqlite'
+    if backend == 'sqlite':
+        from data.plugins.astrbot_plugin_mg_guessr.sqlite_storage import SQLiteStorage, migrate_from_tinydb
+        path = os.path.join(data_dir, 'mg_guessr.sqlite3')
+        # 多个进程同时启动时，建表升级与一次性迁移只由其中一个执行
+        with file_lock(path + '.lock'):
+            storage = SQLiteStorage(path, shared)
+            migrate_from_tinydb(data_dir, storage)
+        return storage
+    if backend != 'tinydb':
+        raise ValueError(f"未知的存储后端: {backend}")
+    return TinyDBStorage(data_dir)
+
+
+# 以原子替换写入文本文件，正在读取旧文件的进程不会看到写了一半的内容
+def write_atomic(path, text):
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        f.write(text)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+
+
+def _write_json_atomic(path, data):
+    write_atomic(path, json.dumps(data, ensure_ascii=False))
+
+
+class GameStore:
+    """
+    进行中对局的独立存储，采用写后（write-behind）策略。
+
+    写入先在内存中按群合并，flush 时把这一批变更作为一行追加到日志文件；
+    日志累计到 compact_every 行或关闭时，再整体写回快照并清空日志。
+    崩溃时最多丢失一个 flush 周期内的变更。
+    """
+
+    def __init__(self, path, compact_every=100):
+        self.path = path
+        self.journal_path = path + '.journal'
+        self.compact_every = compact_every
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._records = {}
+        self._journal_lines = 0
+        self._load()
+
+    def _load(self):
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                self._records = json.load(f)
+        except FileNotFoundError:
+            self._records = {}
+        except ValueError as e:
+            logger.error(f"对局存储损坏，已忽略: {e}")
+            self._records = {}
+
+        try:
+            with open(self.journal_path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        batch = json.loads(line)
+                    except ValueError:
+                        # 最后一行可能在崩溃时只写了一半
+                        break
+                    self._apply(batch)
+                    self._journal_lines += 1
+        except FileNotFoundError:
+            pass
+
+    def _apply(self, batch):
+        for group_id, record in batch.items():
+            if record is None:
+                self._records.pop(group_id, None)
+            else:
+                self._records[group_id] = record
+
+    def exists(self):
+        return os.path.exists(self.path) or os.path.exists(self.journal_path)
+
+    def all(self):
+        with self._lock:
+            records = dict(self._records)
+            for group_id, record in self._pending.items():
+                if record is None:
+                    records.pop(group_id, None)
+                else:
+                    records[group_id] = record
+            return records
+
+    def put(self, group_id, record, last_active=None):
+        with self._lock:
+            self._pending[group_id] = record
+
+    def delete(self, group_id):
+        with self._lock:
+            self._pending[group_id] = None
+
+    def flush(self):
+        with self._lock:
+            if not self._pending:
+                return
+            batch, self._pending = self._pending, {}
+            with open(self.journal_path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps(batch, ensure_ascii=False) + '\n')
+                f.flush()
+                os.fsync(f.fileno())
+            self._apply(batch)
+            self._journal_lines += 1
+            if self._journal_lines >= self.compact_every:
+                self._compact()
+
+    def _compact(self):
+        _write_json_atomic(self.path, self._records)
+        with open(self.journal_path, 'w', encoding='utf-8'):
+            pass
+        self._journal_lines = 0
+
+    def close(self):
+        self.flush()
+        with self._lock:
+            self._compact()
+
+
+class ColdGameStore:
+    """
+    冷对局存储：长时间无人操作的对局移出内存，每局一个文件，下次有消息时再按需载入。
+
+    内存中只保留冷对局的会话 id 集合。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        os.makedirs(path, exist_ok=True)
+        self._ids = {unquote(name[:-5]) for name in os.listdir(path) if name.endswith('.json')}
+
+    def _file(self, group_id):
+        return os.path.join(self.path, quote(group_id, safe='') + '.json')
+
+    def __contains__(self, group_id):
+        return group_id in self._ids
+
+    def __len__(self):
+        return len(self._ids)
+
+    def put(self, group_id, record, last_active=None):
+        with self._lock:
+            path = self._file(group_id)
+            _write_json_atomic(path, record)
+            if last_active is not None:
+                os.utime(path, (last_active, last_active))
+            self._ids.add(group_id)
+
+    def pop(self, group_id):
+        with self._lock:
+            if group_id not in self._ids:
+                return None
+            self._ids.discard(group_id)
+            path = self._file(group_id)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    record = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.error(f"读取冷对局 {group_id} 失败: {e}")
+                record = None
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return record
+
+    def items(self):
+        """遍历全部冷对局 (会话 id, 记录, 最后活跃时间)，不会移除文件"""
+        for group_id in list(self._ids):
+            path = self._file(group_id)
+            try:
+                with open(path, encoding='utf-8') as f:
+                    yield group_id, json.load(f), os.stat(path).st_mtime
+            except (OSError, ValueError) as e:
+                logger.error(f"读取冷对局 {group_id} 失败: {e}")
+
+    def idle_ids(self, idle_seconds):
+        # 以文件修改时间作为冷对局最后活跃时间，避免逐个读取文件
+        deadline = time.time() - idle_seconds
+        with self._lock:
+            ids = list(self._ids)
+        result = []
+        for group_id in ids:
+            try:
+                if os.stat(self._file(group_id)).st_mtime < deadline:
+                    result.append(group_id)
+            except OSError:
+                pass
+        return result
+
+
+class WinnerBoard:
+    """
+    胜场记录：原始胜场日志之外，按群维护胜场计数。
+
+    计数保存在单独的小文件中，每次获胜只追加一次日志、再原子地重写计数文件；
+    计数文件记录了写入时日志文件的大小与修改时间，启动时两者一致即可直接使用，
+    不一致（如两次写入之间崩溃）才解析整个日志重建。排行榜读取缓存的排序结果。
+    """
+
+    def __init__(self, path):
+        self.db = TinyDB(path)
+        self.path = path
+        self.counts_path = os.path.splitext(path)[0] + '_counts.json'
+        self._lock = threading.Lock()
+        self._counts = {}
+        self._ranked = {}
+        self._counts_file = None
+        self._load()
+
+    def _log_stamp(self):
+        st = os.stat(self.path)
+        return [st.st_size, st.st_mtime_ns]
+
+    def _load(self):
+        try:
+            with open(self.counts_path, encoding='utf-8') as f:
+                data = json.load(f)
+            if data.get('source') == self._log_stamp():
+                self._counts = data['counts']
+                return
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError) as e:
+            logger.error(f"胜场计数文件损坏: {e}")
+        logger.info("胜场计数与记录不一致，正在从原始记录重建...")
+        self.rebuild()
+
+    def _write_counts(self):
+        # 计数文件只是可校验的缓存：写了一半或与日志不符时启动会重建，因此不做 fsync 与原子替换；
+        # 与 TinyDB 一样保持文件打开，从头覆盖后截断，避免每次以截断方式重新打开文件
+        if self._counts_file is None:
+            fd = os.open(self.counts_path, os.O_RDWR | os.O_CREAT, 0o644)
+            self._counts_file = open(fd, 'r+', encoding='utf-8')
+        f = self._counts_file
+        f.seek(0)
+        json.dump({'source': self._log_stamp(), 'counts': self._counts}, f, ensure_ascii=False)
+        f.truncate()
+        f.flush()
+
+    def rebuild(self):
+        with self._lock:
+            # 旧版本把计数存放在日志文件的 counts 表中，重建时一并移除
+            if 'counts' in self.db.tables():
+                self.db.drop_table('counts')
+            counts = {}
+            for e in self.db.search(Query().winner.exists()):
+                group = counts.setdefault(e['group'], {})
+                group[e['winner']] = group.get(e['winner'], 0) + 1
+            self._counts = counts
+            self._ranked = {}
+            self._write_counts()
+
+    def record(self, group_id, winner_name):
+        with self._lock:
+            self.db.insert({'group': group_id, 'winner': winner_name, 'time': datetime.now().isoformat()})
+            counts = self._counts.setdefault(group_id, {})
+            counts[winner_name] = counts.get(winner_name, 0) + 1
+            self._ranked.pop(group_id, None)
+            self._write_counts()
+
+    def top(self, group_id, top_n):
+        with self._lock:
+            ranked = self._ranked.get(group_id)
+            if ranked is None:
+                ranked = sorted(self._counts.get(group_id, {}).items(), key=lambda x: x[1], reverse=True)
+                self._ranked[group_id] = ranked
+            return ranked[:top_n]
+
+
+class GroupSettings:
+    """群启用状态：内存集合供权限检查使用，变更随定期 flush 在后台写盘"""
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._enabled = set()
+        self._dirty = False
+        try:
+            with open(path, encoding='utf-8') as f:
+                self._enabled = set(json.load(f).get('enabled', []))
+        except FileNotFoundError:
+            pass
+        except ValueError as e:
+            logger.error(f"群设置文件损坏，已忽略: {e}")
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def is_enabled(self, group_id):
+        return int(group_id) in self._enabled
+
+    def enabled_ids(self):
+        return set(self._enabled)
+
+    def set_enabled(self, group_id, enabled):
+        with self._lock:
+            if enabled:
+                self._enabled.add(int(group_id))
+            else:
+                self._enabled.discard(int(group_id))
+            self._dirty = True
+
+    def flush(self, force=False):
+        with self._lock:
+            if not self._dirty and not force:
+                return
+            _write_json_atomic(self.path, {'enabled': sorted(self._enabled)})
+            self._dirty = False
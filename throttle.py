@@ -0,0 +1,87 @@
+import time
+
+
+class TokenBucket:
+    __slots__ = ('rate', 'capacity', 'tokens', 'updated')
+
+    def __init__(self, rate, capacity, now):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = now
+
+    def take(self, now):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+
+class _Session:
+    __slots__ = ('bucket', 'recent')
+
+    def __init__(self, bucket):
+        self.bucket = bucket
+        # 规范化猜测 -> 合并窗口的截止时间，按插入顺序即按截止时间排列
+        self.recent = {}
+
+
+def _normalize(text):
+    return ' '.join(text.casefold().split())
+
+
+class ChatThrottle:
+    """
+    群内非命令猜测的限流与合并。
+
+    每个会话一个令牌桶，超出速率的消息在解析前直接丢弃；
+    window 秒内重复的规范化猜测只放行第一条，其余视为重复丢弃。
+    rate 为 0 时不限流，window 为 0 时不合并。
+    """
+
+    def __init__(self, rate=3.0, burst=10, window=1.0):
+        self.rate = rate
+        self.burst = burst
+        self.window = window
+        self._sessions = {}
+
+    def check(self, session_id, text, now=None):
+        """放行时返回 None，否则返回丢弃原因：'duplicate' 或 'throttled'"""
+        now = time.monotonic() if now is None else now
+        session = self._sessions.get(session_id)
+        if session is None:
+            session = self._sessions[session_id] = _Session(TokenBucket(self.rate, self.burst, now))
+
+        recent = session.recent
+        while recent:
+            key, deadline = next(iter(recent.items()))
+            if deadline > now:
+                break
+            del recent[key]
+
+        key = _normalize(text)
+        if self.window and key in recent:
+            return 'duplicate'
+        if self.rate and not session.bucket.take(now):
+            return 'throttled'
+        if self.window:
+            recent[key] = now + self.window
+        return None
+
+    def reset(self, session_id):
+        # 新对局开始时清空合并窗口，上一局刚猜过的曲名在新对局中仍需解析
+        session = self._sessions.get(session_id)
+        if session:
+            session.recent.clear()
+
+    def prune(self, idle_seconds, now=None):
+        """移除长时间没有消息的会话（此时令牌桶早已回满，合并窗口也已过期）"""
+        now = time.monotonic() if now is None else now
+        for session_id, session in list(self._sessions.items()):
+            if now - session.bucket.updated >= idle_seconds:
+                del self._sessions[session_id]
+
+    def __len__(self):
+        return len(self._sessions)
@@ -1,48 +1,65 @@
+import argparse
 import os
-from glob import glob
 from tinydb import TinyDB
-from screenshot import capture_screenshots
+from screenshot import ScreenshotPool, URL_TEMPLATE
 from tqdm import tqdm  # 导入tqdm库
-from selenium.common.exceptions import TimeoutException  # 导入TimeoutException
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 # 载入数据库
 db_path = '/opt/astrbot/data/songs_db.json'
-db = TinyDB(db_path)
-
-# 获取arc_data表的数据
-arc_data = db.table('arc_data').all()
 
 # 图像保存路径
 image_path = '/opt/astrbot/data/image'
 
-# 定义处理每首歌的函数
-def process_song(item):
-    song_title = item.get('曲名', '')
-    if song_title:  # 如果“曲名”存在
-        # 构建可能的文件路径，查找类似 {song_title}-a* 的文件
-        file_pattern = os.path.join(image_path, f"{song_title}-a*")
-        existing_files = glob(file_pattern)
-
-        # 如果文件已经存在，跳过该曲目
-        if existing_files:
-            return f"Skipping {song_title}, file already exists."
-
-        try:
-            # 执行截图操作
-            capture_screenshots(song_title)
-            return f"Processed {song_title} successfully."
-        except TimeoutException:
-            return f"TimeoutException occurred for {song_title}, skipping this song."
-        except Exception as e:
-            return f"Error occurred for {song_title}: {e}"
-
-# 使用ThreadPoolExecutor进行并行处理
-with ThreadPoolExecutor(max_workers=10) as executor:
-    # 使用tqdm来显示进度条，total参数设置为arc_data的长度
-    futures = [executor.submit(process_song, item) for item in arc_data]
-    
-    # 遍历返回的future对象并显示结果
-    for future in tqdm(as_completed(futures), total=len(futures), desc="Processing songs", unit="song"):
-        result = future.result()
-        tqdm.write(result)
+def seed_progress(progress, image_dir):
+    # 首次使用进度文件时，把图片目录中已有截图的曲目记为已完成（只列一次目录，不再逐首 glob）
+    if progress.exists() or not os.path.isdir(image_dir):
+        return
+    for name in os.listdir(image_dir):
+        title, sep, _ = name.rpartition('-a-')
+        if sep and title not in progress.done:
+            progress.mark(title)
+
+def main():
+    parser = argparse.ArgumentParser(description="为曲目批量生成提示截图")
+    parser.add_argument('--db', default=db_path, help='songs_db.json 路径')
+    parser.add_argument('--image-dir', default=image_path, help='截图保存目录')
+    parser.add_argument('--workers', type=int, default=4, help='浏览器数量，每个浏览器在整个运行期间复用')
+    parser.add_argument('--retries', type=int, default=2, help='每首失败后的重试次数')
+    parser.add_argument('--page-timeout', type=float, default=30, help='单个页面的加载超时（秒）')
+    parser.add_argument('--progress', help='进度文件，默认保存在截图目录中')
+    parser.add_argument('--url-template', default=URL_TEMPLATE,
+                        help="页面地址模板，可指向本地静态页面，例如 'http://127.0.0.1:8000/{title}.html'")
+    args = parser.parse_args()
+
+    # 获取arc_data表的数据
+    db = TinyDB(args.db)
+    titles = [item['曲名'] for item in db.table('arc_data').all() if item.get('曲名')]
+    db.close()
+
+    pool = ScreenshotPool(
+        size=args.workers,
+        url_template=args.url_template,
+        save_dir=args.image_dir,
+        progress_path=args.progress,
+        retries=args.retries,
+        page_timeout=args.page_timeout,
+    )
+    seed_progress(pool.progress, args.image_dir)
+
+    # 使用tqdm来显示进度条
+    with tqdm(total=len(set(titles)), desc="Processing songs", unit="song") as bar:
+        def on_result(title, status, detail):
+            if status == 'done':
+                tqdm.write(f"Processed {title} successfully ({detail}).")
+            elif status == 'failed':
+                tqdm.write(f"Error occurred for {title}: {detail}")
+            bar.update(1)
+
+        results = pool.run(titles, on_result)
+
+    failed = [title for title, (status, _) in results.items() if status == 'failed']
+    if failed:
+        print(f"{len(failed)} songs failed, rerun to retry: {', '.join(failed)}")
+
+if __name__ == '__main__':
+    main()
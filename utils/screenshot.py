@@ -4,23 +4,24 @@ from selenium.webdriver.common.by import By
 from selenium.webdriver.chrome.service import Service
 from selenium.webdriver.support.ui import WebDriverWait
 from selenium.webdriver.support import expected_conditions as EC
+from selenium.common.exceptions import TimeoutException, WebDriverException
+import json
 import os
+import queue
+import threading
 
-def capture_screenshots(title: str):
-    """
-    截取指定网页的截图，按照指定规则保存。
-
-    :param title: 用于过滤和命名的标题
-    """
-    # 固定的配置
-    url = f'https://arcwiki.mcd.blue/{title}'
-    driver_path = '/AstrBot/data/chrome/chromedriver-linux64/chromedriver'
-    chrome_binary_path = '/AstrBot/data/chrome/chrome-linux64/chrome'
-    save_dir = '/AstrBot/data/image'
-
-    # 创建存储截图的目录（如果不存在的话）
-    os.makedirs(save_dir, exist_ok=True)
+# 页面地址模板；本地测试时可换成静态页面，例如 'http://127.0.0.1:8000/{title}.html'
+URL_TEMPLATE = 'https://arcwiki.mcd.blue/{title}'
+DRIVER_PATH = '/AstrBot/data/chrome/chromedriver-linux64/chromedriver'
+CHROME_BINARY_PATH = '/AstrBot/data/chrome/chrome-linux64/chrome'
+SAVE_DIR = '/AstrBot/data/image'
+# 单个页面的加载超时（秒）
+PAGE_TIMEOUT = 30
+# 等待正文元素出现的超时（秒）
+WAIT_TIMEOUT = 10
 
+def create_driver(driver_path=DRIVER_PATH, chrome_binary_path=CHROME_BINARY_PATH, page_timeout=PAGE_TIMEOUT):
+    """启动一个无头 Chrome，设置好窗口大小与页面加载超时"""
     # 配置 Chrome 选项
     chrome_options = Options()
     chrome_options.add_argument('--headless')
@@ -29,46 +30,172 @@ def capture_screenshots(title: str):
     chrome_options.binary_location = chrome_binary_path
     service = Service(driver_path)
 
-    # 启动浏览器
     driver = webdriver.Chrome(service=service, options=chrome_options)
-
     # 设置浏览器窗口的宽度为450px，高度为900px
     driver.set_window_size(450, 900)
+    driver.set_page_load_timeout(page_timeout)
+    return driver
 
-    driver.get(url)
+def capture_page(driver, title, url_template=URL_TEMPLATE, save_dir=SAVE_DIR, wait_timeout=WAIT_TIMEOUT):
+    """
+    用已启动的浏览器打开曲目页面并截图，按照指定规则保存。
 
-    # 使用显式等待确保页面完全加载
-    try:
-        # 等待 .mw-parser-output 元素加载完毕（最大等待时间 10 秒）
-        WebDriverWait(driver, 10).until(
-            EC.presence_of_element_located((By.CSS_SELECTOR, '.mw-parser-output'))
-        )
-
-        # 获取所有 .mw-parser-output li 元素，排除掉 div 中的 li 和嵌套在其他 li 中的 li
-        list_elements = driver.find_elements(By.CSS_SELECTOR, '.mw-parser-output > ul > li:not(.mw-parser-output div li)')
-        for i, element in enumerate(list_elements, start=1):
-            # 获取每个元素的文本
-            text = element.text
-            if title in text:
-                continue  # 如果文本包含 title，则跳过
-
-            # 截图并保存到指定路径
-            screenshot_name = os.path.join(save_dir, f'{title}-a-{i}.png')
-            element.screenshot(screenshot_name)
-
-        # 获取所有不嵌套的 .comment-thread 元素
-        comment_elements = driver.find_elements(By.CSS_SELECTOR, '.comment-thread:not(.comment-thread .comment-thread)')
-        for i, element in enumerate(comment_elements, start=1):
-            # 获取每个元素的文本
-            text = element.text
-            if title in text:
-                continue  # 如果文本包含 title，则跳过
-
-            # 截图并保存到指定路径
-            screenshot_name = os.path.join(save_dir, f'{title}-b-{i}.png')
-            element.screenshot(screenshot_name)
+    :param title: 用于过滤和命名的标题
+    :return: 保存的截图数量
+    """
+    # 创建存储截图的目录（如果不存在的话）
+    os.makedirs(save_dir, exist_ok=True)
+
+    driver.get(url_template.format(title=title))
+
+    # 等待 .mw-parser-output 元素加载完毕
+    WebDriverWait(driver, wait_timeout).until(
+        EC.presence_of_element_located((By.CSS_SELECTOR, '.mw-parser-output'))
+    )
+
+    saved = 0
+    # 获取所有 .mw-parser-output li 元素，排除掉 div 中的 li 和嵌套在其他 li 中的 li
+    list_elements = driver.find_elements(By.CSS_SELECTOR, '.mw-parser-output > ul > li:not(.mw-parser-output div li)')
+    for i, element in enumerate(list_elements, start=1):
+        # 如果文本包含 title，则跳过
+        if title in element.text:
+            continue
+        element.screenshot(os.path.join(save_dir, f'{title}-a-{i}.png'))
+        saved += 1
+
+    # 获取所有不嵌套的 .comment-thread 元素
+    comment_elements = driver.find_elements(By.CSS_SELECTOR, '.comment-thread:not(.comment-thread .comment-thread)')
+    for i, element in enumerate(comment_elements, start=1):
+        if title in element.text:
+            continue
+        element.screenshot(os.path.join(save_dir, f'{title}-b-{i}.png'))
+        saved += 1
+    return saved
+
+def capture_screenshots(title: str):
+    """
+    截取指定网页的截图（单独启动一个浏览器，用完即关闭）。
 
+    :param title: 用于过滤和命名的标题
+    """
+    driver = create_driver()
+    try:
+        return capture_page(driver, title)
     finally:
-        # 关闭浏览器
         driver.quit()
 
+class Progress:
+    """
+    可续跑的进度文件：每完成一首追加一行 JSON，中断后重新运行会跳过已完成的曲目。
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._lock = threading.Lock()
+        self.done = set()
+        try:
+            with open(path, encoding='utf-8') as f:
+                for line in f:
+                    try:
+                        self.done.add(json.loads(line)['title'])
+                    except (ValueError, KeyError):
+                        # 最后一行可能在中断时只写了一半
+                        continue
+        except FileNotFoundError:
+            pass
+
+    def exists(self):
+        return os.path.exists(self.path)
+
+    def mark(self, title, saved=0):
+        with self._lock:
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(json.dumps({'title': title, 'saved': saved}, ensure_ascii=False) + '\n')
+            self.done.add(title)
+
+class ScreenshotPool:
+    """
+    浏览器工作池：每个工作线程启动一个浏览器并一直复用，从队列中依次取曲名截图。
+
+    页面加载或等待超时会用同一个浏览器重试；浏览器本身出错时关闭并重新启动。
+    每首成功后写入进度文件，失败的曲目不记录，下次运行时会再次尝试。
+    """
+
+    def __init__(self, size=4, url_template=URL_TEMPLATE, save_dir=SAVE_DIR, progress_path=None,
+                 retries=2, page_timeout=PAGE_TIMEOUT, wait_timeout=WAIT_TIMEOUT, driver_factory=None):
+        self.size = size
+        self.url_template = url_template
+        self.save_dir = save_dir
+        self.progress = Progress(progress_path or os.path.join(save_dir, '.screenshot_progress.jsonl'))
+        self.retries = retries
+        self.wait_timeout = wait_timeout
+        self.driver_factory = driver_factory or (lambda: create_driver(page_timeout=page_timeout))
+
+    def run(self, titles, on_result=None):
+        """
+        处理全部曲名，返回 {曲名: (状态, 说明)}，状态为 done / skipped / failed。
+
+        :param on_result: 每首处理完后的回调 on_result(曲名, 状态, 说明)，会在工作线程中调用
+        """
+        results = {}
+        lock = threading.Lock()
+
+        def report(title, status, detail):
+            with lock:
+                results[title] = (status, detail)
+            if on_result:
+                on_result(title, status, detail)
+
+        tasks = queue.Queue()
+        for title in dict.fromkeys(titles):
+            if title in self.progress.done:
+                report(title, 'skipped', "already captured")
+            else:
+                tasks.put(title)
+
+        workers = [threading.Thread(target=self._work, args=(tasks, report), daemon=True)
+                   for _ in range(min(self.size, tasks.qsize()))]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return results
+
+    def _work(self, tasks, report):
+        driver = None
+        try:
+            while True:
+                try:
+                    title = tasks.get_nowait()
+                except queue.Empty:
+                    return
+                error = None
+                for _ in range(self.retries + 1):
+                    try:
+                        if driver is None:
+                            driver = self.driver_factory()
+                        saved = capture_page(driver, title, self.url_template, self.save_dir, self.wait_timeout)
+                        self.progress.mark(title, saved)
+                        report(title, 'done', f"{saved} screenshots")
+                        break
+                    except TimeoutException as e:
+                        error = f"timeout: {e.msg or e}"
+                    except WebDriverException as e:
+                        # 浏览器崩溃或失去响应，换一个新的浏览器再试
+                        error = f"driver error: {e.msg or e}"
+                        driver = self._quit(driver)
+                    except Exception as e:
+                        error = str(e)
+                else:
+                    report(title, 'failed', error)
+        finally:
+            self._quit(driver)
+
+    @staticmethod
+    def _quit(driver):
+        if driver is not None:
+            try:
+                driver.quit()
+            except Exception:
+                pass
+        return None